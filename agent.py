@@ -1,19 +1,27 @@
 import asyncio
 import logging
+from dataclasses import replace
 
 from src.exception import CustomException
 from src.logger import logger
 from src.prompt import *
+from src.query_parser import DESTINATION, WEATHER, CULTURE, TripQuery, parse_query, prefill_geocoding
+from src.prefetch import PrefetchCache, CachedWikipediaTool, CachedOpenMeteoTool, start_prefetch
+from src.incremental import Section, TripPlan, diff_plan, is_acknowledgement, merge_followup, patch_plan
+from src.prompt_cache import PromptCacheStats
+from src.admission import NORMAL, admission_controller
+from src.cassette import current_cassette
+from src.concurrency import specialist_slot
 
 from beeai_framework.agents.requirement import RequirementAgent
 from beeai_framework.agents.requirement.requirements.conditional import ConditionalRequirement
 from beeai_framework.agents.requirement.requirements.ask_permission import AskPermissionRequirement
 from beeai_framework.memory import UnconstrainedMemory
 from beeai_framework.backend import ChatModel, ChatModelParameters
+from beeai_framework.backend.errors import ChatModelToolCallError
 from beeai_framework.tools.search.wikipedia import WikipediaTool
 from beeai_framework.tools.weather import OpenMeteoTool
 from beeai_framework.tools.think import ThinkTool
-from beeai_framework.tools.handoff import HandoffTool
 from beeai_framework.middleware.trajectory import GlobalTrajectoryMiddleware
 from beeai_framework.tools import Tool
 
@@ -27,34 +35,35 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+COORDINATOR = "coordinator"
 
 
-async def multi_agent_travel_planner_with_language(user_query=input_query):
-    """
-    Advanced Multi-Agent Travel Planning System with Language Expert
-    
-    This system demonstrates:
-    1. Specialized agent roles and coordination
-    2. Tool-based inter-agent communication
-    3. Requirements-based execution control
-    4. Language and cultural expertise integration
-    5. Comprehensive travel planning workflow
-    """
-    
-    # Initialize the language model
+def build_llm(max_tokens: int | None = None) -> ChatModel:
+    """Initialize the language model shared by all agents."""
     llm = ChatModel.from_name(os.getenv("LLM_CHAT_MODEL_NAME", "openai:gpt-4o-mini"),
-        ChatModelParameters(temperature=0)
+        ChatModelParameters(temperature=0, max_tokens=max_tokens)
     )
-    
     llm.allow_parallel_tool_calls = True
-    
-    # === AGENT 1: DESTINATION RESEARCH EXPERT ===
-    destination_expert = RequirementAgent(
+    return llm
+
+
+def build_tools(key: str, cache: PrefetchCache) -> list[Tool]:
+    """Tools of each agent, always in the same order so the tool-schema part of the prompt stays stable."""
+    if key in (DESTINATION, CULTURE):
+        return [CachedWikipediaTool(cache), ThinkTool()]
+    if key == WEATHER:
+        return [CachedOpenMeteoTool(cache), ThinkTool()]
+    return []
+
+
+# === AGENT 1: DESTINATION RESEARCH EXPERT ===
+def build_destination_expert(llm: ChatModel, cache: PrefetchCache) -> RequirementAgent:
+    return RequirementAgent(
         llm=llm,
         
-        tools=[WikipediaTool(), ThinkTool()],
+        tools=build_tools(DESTINATION, cache),
         memory=UnconstrainedMemory(),
-        instructions=destination_expert_instruction,
+        instructions=SYSTEM_INSTRUCTIONS[DESTINATION],
         middlewares=[GlobalTrajectoryMiddleware(included=[Tool])],
         requirements=[
             ConditionalRequirement(
@@ -73,13 +82,15 @@ async def multi_agent_travel_planner_with_language(user_query=input_query):
             ),
         ]
     )
-    
-    # === AGENT 2: TRAVEL METEOROLOGIST ===
-    travel_meteorologist = RequirementAgent(
+
+
+# === AGENT 2: TRAVEL METEOROLOGIST ===
+def build_travel_meteorologist(llm: ChatModel, cache: PrefetchCache) -> RequirementAgent:
+    return RequirementAgent(
         llm=llm,
-        tools=[OpenMeteoTool(), ThinkTool()],
+        tools=build_tools(WEATHER, cache),
         memory=UnconstrainedMemory(),
-        instructions=travel_meteorologist_instruction,
+        instructions=SYSTEM_INSTRUCTIONS[WEATHER],
         middlewares=[GlobalTrajectoryMiddleware(included=[Tool])],
         requirements=[
             ConditionalRequirement(
@@ -96,13 +107,15 @@ async def multi_agent_travel_planner_with_language(user_query=input_query):
             )
         ]
     )
-    
-    # === AGENT 3: LANGUAGE & CULTURAL EXPERT ===
-    language_and_culture_expert = RequirementAgent(
+
+
+# === AGENT 3: LANGUAGE & CULTURAL EXPERT ===
+def build_language_and_culture_expert(llm: ChatModel, cache: PrefetchCache) -> RequirementAgent:
+    return RequirementAgent(
         llm=llm,
-        tools=[WikipediaTool(), ThinkTool()],
+        tools=build_tools(CULTURE, cache),
         memory=UnconstrainedMemory(),
-        instructions=lang_and_cultural_expert_instruction,
+        instructions=SYSTEM_INSTRUCTIONS[CULTURE],
         middlewares=[GlobalTrajectoryMiddleware(included=[Tool])],
         requirements=[
             ConditionalRequirement(
@@ -114,39 +127,294 @@ async def multi_agent_travel_planner_with_language(user_query=input_query):
             ),
         ]
     )
-    
-    # === AGENT 4: TRAVEL COORDINATOR (MAIN INTERFACE) ===
-    # Create handoff tools for coordination with unique names
-    handoff_to_destination = HandoffTool(
-        destination_expert,
-        name="DestinationResearch",
-        description="Consult our Destination Research Expert for comprehensive information about travel destinations, attractions, and practical travel guidance."
-    )
-    handoff_to_weather = HandoffTool(
-        travel_meteorologist,
-        name="WeatherPlanning", 
-        description="Consult our Travel Meteorologist for weather forecasts, climate analysis, and weather-appropriate travel recommendations."
-    )
-    handoff_to_language = HandoffTool(
-        language_and_culture_expert,
-        name="LanguageCulturalGuidance",
-        description="Consult our Language & Cultural Expert for essential phrases, cultural etiquette, and communication guidance for respectful travel."
-    )
-    
-    travel_coordinator = RequirementAgent(
+
+
+SPECIALIST_BUILDERS = {
+    DESTINATION: build_destination_expert,
+    WEATHER: build_travel_meteorologist,
+    CULTURE: build_language_and_culture_expert,
+}
+
+
+# === AGENT 4: TRAVEL COORDINATOR (MAIN INTERFACE) ===
+def build_travel_coordinator(llm: ChatModel) -> RequirementAgent:
+    """Coordinator that synthesizes the specialists' reports into one plan."""
+    return RequirementAgent(
         llm=llm,
-        tools=[handoff_to_destination, handoff_to_weather, handoff_to_language, ThinkTool()],
+        tools=[],
         memory=UnconstrainedMemory(),
-        instructions=travel_coordinator_instruction,
+        instructions=SYSTEM_INSTRUCTIONS[COORDINATOR],
         middlewares=[GlobalTrajectoryMiddleware(included=[Tool])],
-        requirements=[
-            ConditionalRequirement(ThinkTool, consecutive_allowed=False),
-            # AskPermissionRequirement([handoff_to_destination, handoff_to_weather, handoff_to_language])
-        ]
     )
+
+
+def build_agents() -> dict[str, RequirementAgent]:
+    """One instance of each agent, used by src.prompt_cache to render their real system prompts."""
+    cache = PrefetchCache()
+    agents = {key: builder(build_llm(), cache) for key, builder in SPECIALIST_BUILDERS.items()}
+    agents[COORDINATOR] = build_travel_coordinator(build_llm())
+    return agents
+
+
+def compose_query(trip: TripQuery, cities: list[str] | None = None) -> str:
+    """Append the pre-parsed trip details (destinations, geocoding, dates) to the query."""
+    query = trip.text
+    context = trip.to_context()
+    if context:
+        query = f"{query}\n\n{context}"
+    if cities and cities != trip.destinations:
+        query = f"{query}\n\nFocus only on: {', '.join(cities)}."
+    return query
+
+
+def build_tracked_llm(agent_name: str, stats: PromptCacheStats | None, max_tokens: int | None = None,
+                      scope: str = "") -> ChatModel:
+    """
+    One llm instance per agent, so prompt caching can be reported per agent.
+    The scope names the agent run (e.g. its cities) for record/replay.
+    """
+    llm = build_llm(max_tokens=max_tokens)
+    if stats is not None:
+        stats.track(llm, agent_name)
+    cassette = current_cassette()
+    if cassette is not None:
+        cassette.wrap_llm(llm, agent_name, scope)
+    return llm
+
+
+async def run_specialist(key: str, cache: PrefetchCache, trip: TripQuery, cities: list[str],
+                         stats: PromptCacheStats | None = None, profile: str | None = None) -> Section:
+    """
+    Run one specialist for the given cities and keep its answer as a plan section.
+    With a profile the section is the traveler's answer itself, written in that
+    response profile's format and token budget.
+    """
+    query = compose_query(trip, cities)
+    scope = ", ".join(cities)
+    async with specialist_slot():
+        if profile is not None:
+            text, profile = await run_in_profile(
+                key, lambda llm: SPECIALIST_BUILDERS[key](llm, cache), query, profile, stats, scope
+            )
+            return Section(specialist=key, cities=cities, text=text, profile=profile)
+        agent = SPECIALIST_BUILDERS[key](build_tracked_llm(key, stats, scope=scope), cache)
+        result = await agent.run(query)
+    return Section(specialist=key, cities=cities, text=result.output_structured.response)
+
+
+def split_per_city(jobs: list[tuple[str, list[str]]], trip: TripQuery) -> list[tuple[str, list[str]]]:
+    """
+    Turn (specialist, cities) jobs into one job per city, grouped by city, so
+    every city gets its own specialist instance with its own tool budget.
+    Culture is country-level: it gets one job per country, covering its cities.
+    """
+    cities = []
+    for _, job_cities in jobs:
+        cities += [city for city in job_cities if city not in cities]
+    per_city = []
+    for city in cities:
+        for key, job_cities in jobs:
+            if city not in job_cities:
+                continue
+            if key != CULTURE:
+                per_city.append((key, [city]))
+                continue
+            same_country = [other for other in job_cities if trip.country_of(other) == trip.country_of(city)]
+            if same_country[0] == city:
+                per_city.append((key, same_country))
+    # Jobs without cities cover the whole trip and stay as they are
+    return per_city + [(key, job_cities) for key, job_cities in jobs if not job_cities]
+
+
+# Profile to fall back to when an answer is cut off at max_tokens
+SHORTER_PROFILE = {"detailed": "standard", "standard": "brief"}
+
+
+def is_truncated_answer(error: BaseException) -> bool:
+    """The answer hit max_tokens, which leaves the final_answer tool call JSON unparsable."""
+    while error is not None:
+        if isinstance(error, ChatModelToolCallError):
+            return True
+        error = error.__cause__
+    return False
+
+
+async def run_in_profile(agent_name: str, build_agent, query: str, profile: str,
+                         stats: PromptCacheStats | None = None, scope: str = "") -> tuple[str, str]:
+    """
+    Answer the query with the agent build_agent(llm) returns, in the given response
+    profile; returns (answer, profile). An answer truncated at max_tokens is
+    retried in the next shorter profile.
+    """
+    while True:
+        llm = build_tracked_llm(
+            agent_name, stats, max_tokens=answer_max_tokens(profile), scope=f"{scope} {profile}".strip()
+        )
+        try:
+            result = await build_agent(llm).run(f"{query}\n\n{response_format(profile)}")
+            return result.output_structured.response, profile
+        except Exception as e:
+            if profile not in SHORTER_PROFILE or not is_truncated_answer(e):
+                raise
+            logger.warning(f"{agent_name} answer truncated in {profile} profile, retrying as {SHORTER_PROFILE[profile]}")
+            profile = SHORTER_PROFILE[profile]
+
+
+async def run_coordinator(query: str, profile: str = DEFAULT_RESPONSE_PROFILE,
+                          stats: PromptCacheStats | None = None) -> str:
+    """Answer the query with the coordinator in the given response profile."""
+    answer, _ = await run_in_profile(COORDINATOR, build_travel_coordinator, query, profile, stats)
+    return answer
+
+
+async def synthesize_plan(plan: TripPlan, profile: str = DEFAULT_RESPONSE_PROFILE,
+                          stats: PromptCacheStats | None = None) -> str:
+    """
+    Let the coordinator merge the plan sections. A single section that the
+    specialist already wrote in this profile is the answer as is.
+    """
+    if len(plan.sections) == 1 and plan.sections[0].profile == profile:
+        return plan.sections[0].text
+    # Dynamic parts only, after the static system prompt
+    query = f"{plan.trip.text}\n\nExpert reports:\n\n{plan.section_text()}"
+    if len(plan.trip.destinations) > 1:
+        query += f"\n\nCity order: {', '.join(plan.trip.destinations)}"
+    return await run_coordinator(query, profile, stats)
+
+
+async def answer_followup(plan: TripPlan, question: str, profile: str = DEFAULT_RESPONSE_PROFILE,
+                          stats: PromptCacheStats | None = None) -> TripPlan:
+    """Answer a follow-up question that leaves the trip as is, from the specialist reports already in the plan."""
+    query = followup_question_instruction.format(question=question, reports=plan.section_text())
+    answer = await run_coordinator(f"{plan.trip.text}\n\n{query}", profile, stats)
+    return replace(plan, answer=answer)
+
+
+async def plan_trip(user_query: str, previous_plan: TripPlan | None = None, multi_city: bool = True,
+                    profile: str = DEFAULT_RESPONSE_PROFILE) -> TripPlan:
+    """
+    Build a structured plan for the query. With a previous plan from the same
+    chat session, the query is read as an edit of that trip and only the
+    specialists affected by the change are rerun: a date change reruns the
+    weather, a new city runs the specialists for that city only. A question
+    that leaves the trip as is ("Do I need a visa?") is answered from the
+    stored sections, a plain "Thanks!" keeps the plan.
+    
+    In multi-city mode each city gets its own destination and weather runs and
+    each country one culture run, executed concurrently under the process-wide
+    MAX_CONCURRENT_SPECIALISTS limit, and the coordinator merges them into one
+    itinerary.
+    
+    The answer follows the response profile (brief by default); details are
+    generated later, per section, with expand_section.
+    """
+    trip = diff = None
+    if previous_plan is not None:
+        trip = await merge_followup(previous_plan.trip, user_query)
+    followup = trip is not None
+    if trip is None:
+        trip = parse_query(user_query)
+    # One concurrent lookup validates the destinations; the weather tool reuses its coordinates
+    await prefill_geocoding(trip)
+    if followup:
+        diff = diff_plan(previous_plan, trip)
+        if diff.is_empty:
+            if is_acknowledgement(user_query):
+                # Nothing to change or answer ("Thanks!"), keep the current plan
+                logger.info("Follow-up only acknowledges the plan, keeping it")
+                return previous_plan
+            # A question about the same trip ("Do I need a visa?"): no specialist has to rerun
+            return await answer_followup(previous_plan, user_query, profile)
+    
+    cache = previous_plan.cache if previous_plan is not None and previous_plan.cache else PrefetchCache()
+    cache.reset_stats()
+    cache.add_locations(trip.geocoding)
+    start_prefetch(trip, cache)
     
+    if diff is not None:
+        jobs = list(diff.reruns.items())
+        logger.info(f"Incremental replanning: {jobs}")
+    else:
+        jobs = [(key, trip.destinations) for key in trip.specialists]
+        logger.info(f"Full planning with specialists: {trip.specialists}")
+    if multi_city:
+        jobs = split_per_city(jobs, trip)
+    
+    stats = PromptCacheStats()
+    # A lone specialist of a new plan answers the traveler directly, in the response profile
+    answer_profile = profile if diff is None and len(jobs) == 1 else None
+    try:
+        sections = await asyncio.gather(
+            *(run_specialist(key, cache, trip, cities, stats, answer_profile) for key, cities in jobs)
+        )
+    finally:
+        await cache.close()
+        logger.info(f"Prefetch report: {cache.report()}")
+    
+    if diff is not None:
+        plan = patch_plan(previous_plan, trip, diff, list(sections))
+    else:
+        plan = TripPlan(trip=trip, sections=list(sections), cache=cache)
+    plan.answer = await synthesize_plan(plan, profile, stats)
+    logger.info(f"Prompt cache report: {stats.report()}")
+    return plan
 
-    query = user_query
+
+async def expand_section(plan: TripPlan, index: int, profile: str = "detailed",
+                         stats: PromptCacheStats | None = None) -> str:
+    """
+    Generate the detailed version of one plan section on demand, from the
+    specialist report already stored in the plan (no specialist rerun). A
+    section the specialist already wrote as the answer in a shorter profile
+    holds no full report, so that specialist reruns in the longer profile on
+    the plan's tool cache instead.
+    """
+    section = plan.sections[index]
+    key = (section.specialist, tuple(section.cities), profile)
+    if key in plan.expanded:
+        return plan.expanded[key]
+    if section.profile is not None:
+        cache = plan.cache or PrefetchCache()
+        expanded = await run_specialist(section.specialist, cache, plan.trip, section.cities, stats, profile)
+        plan.expanded[key] = expanded.text
+    else:
+        query = expand_section_instruction.format(
+            title=section.specialist,
+            scope=", ".join(section.cities) or "the whole trip",
+            report=section.text,
+        )
+        plan.expanded[key] = await run_coordinator(f"{plan.trip.text}\n\n{query}", profile, stats)
+    return plan.expanded[key]
+
+
+async def multi_agent_travel_planner_with_language(user_query=input_query, previous_plan: TripPlan | None = None, return_plan: bool = False,
+                                                   multi_city: bool = True, profile: str = DEFAULT_RESPONSE_PROFILE):
+    """
+    Advanced Multi-Agent Travel Planning System with Language Expert
+    
+    This system demonstrates:
+    1. Specialized agent roles and coordination
+    2. Tool-based inter-agent communication
+    3. Requirements-based execution control
+    4. Language and cultural expertise integration
+    5. Comprehensive travel planning workflow
+    
+    A local query pre-parser runs first: it pre-selects the specialists the
+    question needs and geocodes the candidate destinations, dropping the ones
+    that aren't real places. The weather tool reuses those coordinates.
+    Narrow questions that need a single specialist skip the coordinator run
+    entirely.
+    
+    Wikipedia and weather fetches for the recognized destinations start
+    speculatively right after geocoding, while the agents are still thinking,
+    and land in the tool cache shared by all specialists.
+    
+    Pass the previous TripPlan (return_plan=True returns it) to replan
+    incrementally when the user only edits part of the trip. Multi-city
+    trips fan out one set of specialists per city unless multi_city=False.
+    profile picks the answer length (brief / standard / detailed).
+    """
+    
     # """I'm planning a 2-week cultural immersion trip to Japan (Tokyo and Osaka) as a first-time visitor. 
     # I want to experience traditional culture, visit historical sites, and interact with locals. 
     # I speak only English and want to be respectful of Japanese customs. 
@@ -158,11 +426,10 @@ async def multi_agent_travel_planner_with_language(user_query=input_query):
     
 
     try:
-        result = await travel_coordinator.run(query)
-        print(f"full result dict: \n{result.model_dump()}")
-        # print(f"\n📋 Comprehensive Travel Plan:\n{result.output_structured.response}")
+        plan = await plan_trip(user_query, previous_plan, multi_city=multi_city, profile=profile)
+        # print(f"\n📋 Comprehensive Travel Plan:\n{plan.answer}")
         
-        return result.output_structured.response
+        return plan if return_plan else plan.answer
     
     except Exception as e:
         print("\n" + "---" * 10)
@@ -175,6 +442,56 @@ async def multi_agent_travel_planner_with_language(user_query=input_query):
             print(f"\nOriginal Cause: {e.__cause__}")
         print("---" * 10 + "\n")
 
+async def admitted_travel_planner(user_query: str, user_id: str, priority: str = NORMAL,
+                                  previous_plan: TripPlan | None = None, return_plan: bool = False,
+                                  multi_city: bool = True, profile: str = DEFAULT_RESPONSE_PROFILE):
+    """
+    multi_agent_travel_planner_with_language behind the admission controller.
+    Raises AdmissionRejected when the user's quota is exhausted or the system
+    is overloaded; plans admitted under pressure run degraded (brief, one run
+    per specialist), and identical new queries may be answered from cache.
+    """
+    # Only standalone queries can be answered from cache, follow-ups depend on the session's plan
+    cache_key = user_query if previous_plan is None else None
+    ticket = await asyncio.to_thread(admission_controller.acquire, user_id, priority, cache_key)
+    if ticket.cached_answer is not None:
+        if return_plan:
+            return TripPlan(trip=parse_query(user_query), answer=ticket.cached_answer)
+        return ticket.cached_answer
+    
+    if ticket.degraded:
+        profile, multi_city = "brief", False
+    try:
+        result = await multi_agent_travel_planner_with_language(
+            user_query, previous_plan, return_plan=return_plan, multi_city=multi_city, profile=profile
+        )
+    finally:
+        admission_controller.release(ticket)
+    
+    answer = result.answer if isinstance(result, TripPlan) else result
+    if answer and cache_key is not None:
+        admission_controller.remember(cache_key, answer)
+    return result
+
+async def admitted_expand_section(plan: TripPlan, index: int, user_id: str, priority: str = NORMAL,
+                                  profile: str = "detailed") -> str:
+    """
+    expand_section behind the admission controller, with the same quota and
+    in-flight limit as plans. Already expanded sections are served without
+    admission; under pressure the expansion is written one profile shorter.
+    """
+    section = plan.sections[index]
+    key = (section.specialist, tuple(section.cities), profile)
+    if key in plan.expanded:
+        return plan.expanded[key]
+    ticket = await asyncio.to_thread(admission_controller.acquire, user_id, priority)
+    if ticket.degraded:
+        profile = SHORTER_PROFILE.get(profile, profile)
+    try:
+        return await expand_section(plan, index, profile=profile)
+    finally:
+        admission_controller.release(ticket)
+
 async def main(input_query) -> None:
     logging.getLogger('asyncio').setLevel(logging.CRITICAL)
     
@@ -0,0 +1,289 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.logger import logger
+
+
+# Priority classes, lower rank is served first when plans have to queue
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+PRIORITY_RANK = {HIGH: 0, NORMAL: 1, LOW: 2}
+# How long each class may wait for a free slot before it is shed (seconds)
+QUEUE_TIMEOUT = {HIGH: 60.0, NORMAL: 30.0, LOW: 5.0}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a plan request is not admitted (quota exhausted or system overloaded)."""
+
+    def __init__(self, reason: str, retry_after: float | None = None):
+        message = reason if retry_after is None else f"{reason} Please retry in {retry_after:.0f}s."
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self) -> None:
+        """Give back a token taken for a request that didn't run."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def retry_after(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+@dataclass
+class Ticket:
+    """Outcome of an admission: run the plan (maybe degraded) or serve a cached answer."""
+    user_id: str
+    priority: str
+    degraded: bool = False
+    cached_answer: str | None = None
+    waited_seconds: float = 0.0
+    holds_slot: bool = False
+
+
+class AdmissionController:
+    """
+    Admission control in front of the planner, shared by every session of the
+    process (thread-safe, each Streamlit run has its own thread and event loop).
+
+    - per-user token-bucket quotas
+    - a global cap on plans in flight, with a priority-ordered wait queue
+    - graceful degradation under overload: queued or late plans run in brief
+      mode, and when nothing can run a recent answer to the same query is
+      served from cache
+    """
+
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 8, user_rate_per_minute: float = 2.0,
+                 user_burst: int = 3, cached_answers: int = 64):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+
+        self._lock = threading.Condition()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._in_flight = 0
+        self._queue: list[tuple[int, int]] = []
+        self._shed: set[tuple[int, int]] = set()
+        self._sequence = itertools.count()
+        self._answers: OrderedDict[str, str] = OrderedDict()
+        self._max_answers = cached_answers
+        self._metrics = {
+            "admitted_total": 0,
+            "degraded_total": 0,
+            "served_cached_total": 0,
+            "queued_total": 0,
+            "queue_timeouts_total": 0,
+            "rejected_quota_total": 0,
+            "rejected_overload_total": 0,
+            "queue_wait_seconds_total": 0.0,
+        }
+
+    @staticmethod
+    def _cache_key(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def _cached(self, query: str | None) -> str | None:
+        if query is None:
+            return None
+        return self._answers.get(self._cache_key(query))
+
+    def _serve_cached_or_reject(self, ticket: Ticket, query: str | None, reason: str) -> Ticket:
+        # Nothing runs for this request, so it doesn't count against the user's quota
+        self._buckets[ticket.user_id].refund()
+        answer = self._cached(query)
+        if answer is not None:
+            self._metrics["served_cached_total"] += 1
+            ticket.cached_answer = answer
+            ticket.degraded = True
+            logger.info(f"Admission: serving cached plan to {ticket.user_id} ({reason})")
+            return ticket
+        self._metrics["rejected_overload_total"] += 1
+        logger.warning(f"Admission: rejected {ticket.user_id} ({reason})")
+        raise AdmissionRejected("The planner is overloaded right now.", retry_after=QUEUE_TIMEOUT[ticket.priority])
+
+    def acquire(self, user_id: str, priority: str = NORMAL, query: str | None = None) -> Ticket:
+        """
+        Block until the request may run, or raise AdmissionRejected.
+        Pass query to allow falling back to a cached answer for the same query.
+        """
+        if priority not in PRIORITY_RANK:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITY_RANK)}")
+        ticket = Ticket(user_id=user_id, priority=priority)
+        with self._lock:
+            bucket = self._buckets.setdefault(user_id, TokenBucket(self.user_rate, self.user_burst))
+            if not bucket.try_take():
+                self._metrics["rejected_quota_total"] += 1
+                logger.warning(f"Admission: quota exhausted for {user_id}")
+                raise AdmissionRejected("You have reached your plan quota.", retry_after=bucket.retry_after())
+
+            if self._in_flight < self.max_in_flight and not self._queue:
+                return self._admit(ticket)
+
+            if len(self._queue) >= self.max_queue:
+                lowest = max(self._queue, default=None)
+                if lowest is None or lowest[0] <= PRIORITY_RANK[priority]:
+                    return self._serve_cached_or_reject(ticket, query, "queue full")
+                # Shed the newest waiter of the lowest class to make room for this one
+                self._queue.remove(lowest)
+                heapq.heapify(self._queue)
+                self._shed.add(lowest)
+                self._lock.notify_all()
+
+            entry = (PRIORITY_RANK[priority], next(self._sequence))
+            heapq.heappush(self._queue, entry)
+            self._metrics["queued_total"] += 1
+            started = time.monotonic()
+            deadline = started + QUEUE_TIMEOUT[priority]
+            while not (self._queue and self._queue[0] == entry and self._in_flight < self.max_in_flight):
+                if entry in self._shed:
+                    self._shed.discard(entry)
+                    return self._serve_cached_or_reject(ticket, query, "shed for higher priority")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._metrics["queue_timeouts_total"] += 1
+                    self._lock.notify_all()
+                    return self._serve_cached_or_reject(ticket, query, "queue timeout")
+                self._lock.wait(remaining)
+
+            heapq.heappop(self._queue)
+            ticket.waited_seconds = time.monotonic() - started
+            self._metrics["queue_wait_seconds_total"] += ticket.waited_seconds
+            # Anyone who had to wait runs a brief plan so the backlog drains faster
+            ticket.degraded = True
+            self._lock.notify_all()
+            return self._admit(ticket)
+
+    def _admit(self, ticket: Ticket) -> Ticket:
+        self._in_flight += 1
+        ticket.holds_slot = True
+        self._metrics["admitted_total"] += 1
+        if ticket.degraded:
+            self._metrics["degraded_total"] += 1
+        logger.info(f"Admission: admitted {ticket.user_id} (priority={ticket.priority}, degraded={ticket.degraded})")
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        if not ticket.holds_slot:
+            return
+        with self._lock:
+            self._in_flight -= 1
+            ticket.holds_slot = False
+            self._lock.notify_all()
+
+    def remember(self, query: str, answer: str) -> None:
+        """Keep a finished answer to serve identical queries under overload."""
+        with self._lock:
+            key = self._cache_key(query)
+            self._answers[key] = answer
+            self._answers.move_to_end(key)
+            while len(self._answers) > self._max_answers:
+                self._answers.popitem(last=False)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                **self._metrics,
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+            }
+
+    def export_metrics(self) -> str:
+        """Metrics in Prometheus text exposition format."""
+        lines = []
+        for name, value in self.metrics().items():
+            metric = f"travel_planner_admission_{name}"
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide controller, configured from the environment
+admission_controller = AdmissionController(
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "4")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "8")),
+    user_rate_per_minute=float(os.getenv("ADMISSION_USER_PLANS_PER_MINUTE", "2")),
+    user_burst=int(os.getenv("ADMISSION_USER_BURST", "3")),
+)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = admission_controller.export_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: int | None = None) -> ThreadingHTTPServer | None:
+    """
+    Serve the admission metrics for Prometheus at http://<host>:<port>/metrics,
+    from a daemon thread of the process running the planner (the Streamlit app),
+    since the controller only sees that process's plans. The port comes from
+    ADMISSION_METRICS_PORT when not given; without one nothing is served.
+    Safe to call on every Streamlit rerun, the server starts once.
+
+        scrape_configs:
+          - job_name: travel_planner
+            static_configs:
+              - targets: ["<host>:<ADMISSION_METRICS_PORT>"]
+    """
+    global _metrics_server
+    port = port or int(os.getenv("ADMISSION_METRICS_PORT", "0"))
+    if not port:
+        return None
+    with _metrics_lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                logger.warning(f"Admission metrics server not started on port {port}: {e}")
+                return None
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+            logger.info(f"Serving admission metrics on port {port} at /metrics")
+    return _metrics_server
@@ -0,0 +1,265 @@
+import contextvars
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from beeai_framework.backend import AssistantMessage, ChatModelOutput
+from beeai_framework.backend.types import ChatModelUsage
+from beeai_framework.tools import JSONToolOutput, StringToolOutput
+from beeai_framework.tools.search.wikipedia import WikipediaToolOutput
+from beeai_framework.tools.search.wikipedia.wikipedia import WikipediaToolResult
+
+from src.logger import logger
+from src.prompt_cache import estimate_tokens
+
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Cassette of the planning run in progress (None = live, nothing recorded)
+_active = contextvars.ContextVar("cassette", default=None)
+
+
+def current_cassette():
+    return _active.get()
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when the run asks for an interaction the cassette does not have."""
+
+
+@dataclass
+class RunMetrics:
+    """Cost and latency figures of one recorded or replayed run."""
+    llm_calls: Counter = field(default_factory=Counter)
+    tool_calls: Counter = field(default_factory=Counter)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    wall_seconds: float = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "llm_calls": sum(self.llm_calls.values()),
+            "tool_calls": sum(self.tool_calls.values()),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            # In replay every LLM/tool call returns instantly, so wall time is orchestration overhead
+            "overhead_seconds": round(self.wall_seconds, 3),
+            "llm_calls_per_agent": dict(self.llm_calls),
+            "tool_calls_per_tool": dict(self.tool_calls),
+        }
+
+
+def _key(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# The system prompt ends with the current date and time, which would change every key
+_CURRENT_DATE_LINE = re.compile(r"^.*The current date and time is:.*$\n?", re.MULTILINE)
+
+
+def _prompt_data(chat_input) -> dict:
+    messages = [
+        [str(getattr(message, "role", "")), _CURRENT_DATE_LINE.sub("", getattr(message, "text", str(message)))]
+        for message in getattr(chat_input, "messages", [])
+    ]
+    tools = [getattr(tool, "name", str(tool)) for tool in getattr(chat_input, "tools", None) or []]
+    return {"messages": messages, "tools": tools}
+
+
+def _dump_llm_output(output: ChatModelOutput) -> dict:
+    data = output.model_dump(mode="json", exclude={"output"})
+    data["output"] = [message.to_plain() for message in output.output]
+    return data
+
+
+def _load_llm_output(data: dict) -> ChatModelOutput:
+    # Models only ever answer with assistant messages (text and tool calls)
+    return ChatModelOutput.model_validate({
+        **data,
+        "output": [AssistantMessage(message["content"]) for message in data["output"]],
+        "usage": ChatModelUsage.model_validate(data["usage"]),
+    })
+
+
+def _dump_tool_output(output) -> dict:
+    if isinstance(output, WikipediaToolOutput):
+        return {"type": "wikipedia", "results": [result.model_dump(mode="json") for result in output.results]}
+    if isinstance(output, JSONToolOutput):
+        return {"type": "json", "result": output.to_json_safe()}
+    return {"type": "text", "text": output.get_text_content()}
+
+
+def _load_tool_output(data: dict):
+    if data["type"] == "wikipedia":
+        return WikipediaToolOutput([WikipediaToolResult.model_validate(result) for result in data["results"]])
+    if data["type"] == "json":
+        return JSONToolOutput(data["result"])
+    return StringToolOutput(data["text"])
+
+
+def _identity(value):
+    return value
+
+
+# (to JSON, from JSON) per interaction kind; geocoding results are plain JSON already
+_CODECS = {
+    "llm": (_dump_llm_output, _load_llm_output),
+    "llm_stream": (
+        lambda chunks: [_dump_llm_output(chunk) for chunk in chunks],
+        lambda chunks: [_load_llm_output(chunk) for chunk in chunks],
+    ),
+    "tool": (_dump_tool_output, _load_tool_output),
+    "geocode": (_identity, _identity),
+}
+
+
+class Cassette:
+    """
+    Record/replay of every LLM, tool and geocoding interaction of a planning run.
+
+    Record mode runs live and stores each interaction's result as JSON; replay
+    mode serves them back without any network access. Interactions are matched
+    by content (agent or tool name + input). LLM calls are also keyed by the
+    agent instance they belong to (its scope, e.g. the cities of a specialist
+    run) and their step within that run, so concurrent runs of the same agent
+    can't be served each other's answers. When an LLM prompt changed since
+    recording (e.g. an edited instruction) the unused interaction at the same
+    scope and step is served instead and counted in `stale_matches`.
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY):
+        self.path = path
+        self.mode = mode
+        self.interactions: list[dict] = []
+        self.metrics = RunMetrics()
+        self.stale_matches = 0
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            with open(path) as f:
+                self.interactions = json.load(f)["interactions"]
+            for interaction in self.interactions:
+                interaction["used"] = False
+
+    @contextmanager
+    def use(self):
+        """Activate the cassette for everything run inside the block."""
+        token = _active.set(self)
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.metrics.wall_seconds += time.perf_counter() - started
+            _active.reset(token)
+
+    def save(self, extra: dict | None = None) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({**(extra or {}), "metrics": self.metrics.summary(), "interactions": self.interactions}, f, indent=1)
+        logger.info(f"Saved cassette {self.path} with {len(self.interactions)} interactions")
+
+    def _replay(self, kind: str, name: str, key: str, position: dict | None = None):
+        with self._lock:
+            candidates = [
+                i for i in self.interactions
+                if not i["used"] and i["kind"] == kind and i["name"] == name
+                and all(i.get(field) == value for field, value in (position or {}).items())
+            ]
+            match = next((i for i in candidates if i["key"] == key), None)
+            if match is None and candidates and position is not None:
+                match = candidates[0]
+                self.stale_matches += 1
+            if match is None:
+                raise CassetteMiss(f"No recorded {kind} interaction left for {name}, re-record the cassette")
+            match["used"] = True
+        return _CODECS[kind][1](match["payload"])
+
+    def _record(self, kind: str, name: str, key: str, value, duration: float, position: dict | None = None) -> None:
+        with self._lock:
+            self.interactions.append({
+                "kind": kind,
+                "name": name,
+                "key": key,
+                **(position or {}),
+                "duration": round(duration, 3),
+                "payload": _CODECS[kind][0](value),
+            })
+
+    def call(self, kind: str, name: str, key_data, fn):
+        """Record or replay a synchronous call."""
+        key = _key(key_data)
+        if self.mode == REPLAY:
+            return self._replay(kind, name, key)
+        started = time.perf_counter()
+        value = fn()
+        self._record(kind, name, key, value, time.perf_counter() - started)
+        return value
+
+    async def acall(self, kind: str, name: str, key_data, fetch, position: dict | None = None):
+        """
+        Record or replay an awaitable call; fetch returns the coroutine to await.
+        With a position (scope and step of an LLM call) a changed input is
+        served the recording at the same position instead of missing.
+        """
+        key = _key(key_data)
+        if self.mode == REPLAY:
+            return self._replay(kind, name, key, position)
+        started = time.perf_counter()
+        value = await fetch()
+        self._record(kind, name, key, value, time.perf_counter() - started, position)
+        return value
+
+    def count_tool_call(self, name: str) -> None:
+        self.metrics.tool_calls[name] += 1
+
+    def wrap_llm(self, llm, agent_name: str, scope: str = ""):
+        """
+        Route the llm's create calls (plain and streaming) through the cassette.
+        The llm belongs to one agent run; scope tells apart concurrent runs of
+        the same agent (e.g. the cities of a specialist run).
+        """
+        original_create = llm._create
+        original_stream = llm._create_stream
+        steps = itertools.count()
+
+        def position() -> dict:
+            return {"scope": scope, "step": next(steps)}
+
+        def count(chat_input) -> dict:
+            data = _prompt_data(chat_input)
+            self.metrics.llm_calls[agent_name] += 1
+            # Estimated from the current prompt, so prompt edits show up even when replaying
+            self.metrics.prompt_tokens += estimate_tokens(json.dumps(data["messages"]))
+            return data
+
+        def count_output(output) -> None:
+            usage = getattr(output, "usage", None)
+            if usage is not None:
+                self.metrics.completion_tokens += usage.completion_tokens or 0
+
+        async def _create(chat_input, run):
+            data = count(chat_input)
+            output = await self.acall("llm", agent_name, data, lambda: original_create(chat_input, run), position())
+            count_output(output)
+            return output
+
+        async def _collect(chat_input, run) -> list:
+            return [chunk async for chunk in original_stream(chat_input, run)]
+
+        async def _create_stream(chat_input, run):
+            data = count(chat_input)
+            chunks = await self.acall("llm_stream", agent_name, data, lambda: _collect(chat_input, run), position())
+            for chunk in chunks:
+                count_output(chunk)
+                yield chunk
+
+        llm._create = _create
+        llm._create_stream = _create_stream
+        return llm
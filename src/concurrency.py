@@ -0,0 +1,29 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
+
+# Upper bound on specialist agent runs in flight at once, across every plan of the process
+MAX_CONCURRENT_SPECIALISTS = int(os.getenv("MAX_CONCURRENT_SPECIALISTS", "4"))
+SPECIALIST_SLOT_POLL_SECONDS = 0.05
+
+# Each Streamlit run plans in its own thread and event loop, so the limit is a
+# thread-level semaphore. It lives here rather than in agent.py because the
+# Streamlit apps re-import agent on every rerun, which would create a new one.
+_specialist_slots = threading.BoundedSemaphore(MAX_CONCURRENT_SPECIALISTS)
+
+
+@asynccontextmanager
+async def specialist_slot():
+    """
+    Hold one of the process-wide specialist slots. Waiting polls instead of
+    blocking in asyncio.to_thread, so queued specialists don't tie up the
+    default executor that geocoding and admission use.
+    """
+    while not _specialist_slots.acquire(blocking=False):
+        await asyncio.sleep(SPECIALIST_SLOT_POLL_SECONDS)
+    try:
+        yield
+    finally:
+        _specialist_slots.release()
@@ -0,0 +1,201 @@
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+from src.logger import logger
+from src.query_parser import (
+    DESTINATION, WEATHER, CULTURE, TripQuery, detect_needs, extract_duration, parse_query, prefill_geocoding,
+)
+
+
+_ADD_WORDS = ("add", "also", "plus", "as well", "too", "extend")
+# Messages made only of these words acknowledge the plan ("Thanks!", "OK, got it") and need no answer
+_ACKNOWLEDGEMENT_WORDS = {
+    "thanks", "thank", "you", "thx", "ty", "ok", "okay", "alright", "great", "cool", "nice",
+    "perfect", "awesome", "lovely", "sounds", "looks", "good", "got", "it", "that's", "so",
+    "very", "much", "a", "lot", "cheers", "bye", "fine",
+}
+_REMOVE_WORDS = ("remove", "drop", "skip", "exclude", "without")
+# "Replace Florence with Venice", "swap rome for naples" -> (old, new)
+_REPLACE = re.compile(
+    r"\b(?i:replace|swap)\s+([\w'\- ]+?)\s+(?i:with|for|by)\s+([\w'\-]+(?:\s+[A-Z][\w'\-]+)*)"
+)
+# "Venice instead of Florence" -> (new, old)
+_INSTEAD_OF = re.compile(r"([A-Z][\w'\-]+(?:\s+[A-Z][\w'\-]+)*)\s+(?i:instead\s+of)\s+([\w'\- ]+?)\s*(?:[.,;!?]|$)")
+
+
+@dataclass
+class Section:
+    """One specialist's findings for a set of cities (empty = the whole trip)."""
+    specialist: str
+    cities: list[str]
+    text: str
+    profile: str | None = None  # response profile, when the text already is the traveler's answer
+
+
+@dataclass
+class TripPlan:
+    """Structured result of a planning run, kept per chat session for follow-ups."""
+    trip: TripQuery
+    sections: list[Section] = field(default_factory=list)
+    answer: str = ""
+    cache: Any = None  # PrefetchCache reused by follow-up runs
+    expanded: dict = field(default_factory=dict)  # (specialist, cities, profile) -> detailed text
+
+    def section_text(self) -> str:
+        """Specialist findings formatted for the coordinator's synthesis step."""
+        order = {city: index for index, city in enumerate(self.trip.destinations)}
+        # Group by city in travel order, whole-trip sections last
+        sections = sorted(
+            self.sections,
+            key=lambda section: min((order.get(city, len(order)) for city in section.cities), default=len(order)),
+        )
+        blocks = []
+        for section in sections:
+            scope = ", ".join(section.cities) if section.cities else "whole trip"
+            blocks.append(f"### {section.specialist.title()} ({scope})\n{section.text}")
+        return "\n\n".join(blocks)
+
+
+@dataclass
+class PlanDiff:
+    """Specialist reruns (specialist -> cities) needed to bring a plan up to date."""
+    reruns: dict[str, list[str]] = field(default_factory=dict)
+    removed_cities: list[str] = field(default_factory=list)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.reruns and not self.removed_cities
+
+
+def _has_word(text: str, words) -> bool:
+    lowered = text.lower()
+    return any(re.search(rf"\b{re.escape(word)}\b", lowered) for word in words)
+
+
+def is_acknowledgement(text: str) -> bool:
+    """The message only acknowledges the plan, there is no question to answer."""
+    words = re.findall(r"[\w']+", text.lower())
+    return all(word in _ACKNOWLEDGEMENT_WORDS for word in words)
+
+
+def _find_replacement(text: str, destinations: list[str]) -> tuple[str, str] | None:
+    """(old, new) city when the message swaps one destination for another."""
+    pairs = [match.groups() for match in _REPLACE.finditer(text)]
+    pairs += [(old, new) for new, old in (match.groups() for match in _INSTEAD_OF.finditer(text))]
+    known = {city.lower(): city for city in destinations}
+    for old, new in pairs:
+        if old.strip().lower() in known:
+            new = new.strip()
+            return known[old.strip().lower()], new if new[:1].isupper() else new.title()
+    return None
+
+
+async def merge_followup(previous: TripQuery, text: str) -> TripQuery | None:
+    """
+    Interpret a chat message as an edit of the previous trip.
+    Returns None when it reads like a brand-new trip rather than an edit.
+    """
+    edit = parse_query(text)
+    # Only real places can start a new trip: "Is it safe to walk at night?" yields "Walk At"
+    await prefill_geocoding(edit)
+    replacement = _find_replacement(text, previous.destinations)
+    adding = _has_word(text, _ADD_WORDS)
+    removing = _has_word(text, _REMOVE_WORDS)
+    overlap = set(edit.destinations) & set(previous.destinations)
+
+    if edit.destinations and not (replacement or adding or removing or overlap):
+        return None
+
+    destinations = list(previous.destinations)
+    if replacement:
+        old, new = replacement
+        destinations = [new if city == old else city for city in destinations if city != new]
+    elif removing:
+        destinations = [city for city in destinations if city not in edit.destinations]
+    elif edit.destinations:
+        destinations += [city for city in edit.destinations if city not in destinations]
+
+    start_date, end_date = previous.start_date, previous.end_date
+    if edit.start_date:
+        start_date, end_date = edit.start_date, edit.end_date
+        single_day = end_date is None or end_date == start_date
+        if single_day and extract_duration(text) is None and previous.start_date and previous.end_date:
+            # "Make it June 3" moves the trip, it doesn't shorten it to one day
+            end_date = start_date + (previous.end_date - previous.start_date)
+
+    needs = set(previous.specialists) | set(detect_needs(text))
+    merged = replace(
+        previous,
+        text=f"{previous.text}\n\nUpdate: {text}",
+        destinations=destinations,
+        start_date=start_date,
+        end_date=end_date,
+        interests=previous.interests + [i for i in edit.interests if i not in previous.interests],
+        needs_destination=DESTINATION in needs,
+        needs_weather=WEATHER in needs,
+        needs_culture=CULTURE in needs,
+        geocoding={**previous.geocoding, **edit.geocoding},
+    )
+    return merged
+
+
+def diff_plan(previous: TripPlan, trip: TripQuery) -> PlanDiff:
+    """Work out which specialists have to rerun, and for which cities."""
+    old = previous.trip
+    diff = PlanDiff()
+    everywhere = list(trip.destinations)
+
+    def rerun(specialist: str, cities: list[str]) -> None:
+        if specialist not in trip.specialists:
+            return
+        current = diff.reruns.setdefault(specialist, [])
+        current += [city for city in cities if city not in current]
+
+    # Specialists that were not part of the previous plan run for every city
+    for specialist in trip.specialists:
+        if specialist not in old.specialists:
+            rerun(specialist, everywhere)
+
+    added = [city for city in trip.destinations if city not in old.destinations]
+    diff.removed_cities = [city for city in old.destinations if city not in trip.destinations]
+    if added:
+        # Culture is country-level, a new city in a country the plan already covers needs no run
+        covered_countries = {
+            trip.country_of(city)
+            for section in previous.sections
+            if section.specialist == CULTURE
+            for city in section.cities
+            if city in trip.destinations
+        }
+        for specialist in trip.specialists:
+            cities = added
+            if specialist == CULTURE:
+                cities = [city for city in added if trip.country_of(city) not in covered_countries]
+            if cities:
+                rerun(specialist, cities)
+
+    if (trip.start_date, trip.end_date) != (old.start_date, old.end_date):
+        rerun(WEATHER, everywhere)
+    if trip.interests != old.interests:
+        rerun(DESTINATION, everywhere)
+
+    logger.info(f"Plan diff: reruns={diff.reruns} removed={diff.removed_cities}")
+    return diff
+
+
+def patch_plan(previous: TripPlan, trip: TripQuery, diff: PlanDiff, new_sections: list[Section]) -> TripPlan:
+    """Replace the outdated sections of the previous plan with the rerun ones."""
+    removed = set(diff.removed_cities)
+    # Cities freshly covered by each specialist (per-city reruns add up)
+    covered: dict[str, set[str]] = {}
+    for new in new_sections:
+        covered.setdefault(new.specialist, set()).update(new.cities)
+    sections = []
+    for section in previous.sections:
+        if section.cities and set(section.cities) <= removed:
+            continue
+        if section.specialist in covered and set(section.cities) - removed <= covered[section.specialist]:
+            continue
+        sections.append(section)
+    return TripPlan(trip=trip, sections=sections + new_sections, cache=previous.cache)
@@ -0,0 +1,250 @@
+import asyncio
+import contextvars
+import time
+from dataclasses import dataclass
+
+from beeai_framework.tools.search.wikipedia import WikipediaTool
+from beeai_framework.tools.weather import OpenMeteoTool
+
+from src.cassette import current_cassette
+from src.logger import logger
+from src.query_parser import TripQuery
+
+
+# Set inside prefetch tasks so the cache can tell speculative fetches apart
+_speculative = contextvars.ContextVar("speculative", default=False)
+
+
+@dataclass
+class _Entry:
+    task: asyncio.Task
+    started_at: float
+    speculative: bool
+    finished_at: float | None = None
+    claimed: bool = False  # a specialist already used this speculative result
+
+
+class PrefetchCache:
+    """
+    Tool result cache shared by all agents of one planning run.
+    Entries hold the fetch task itself, so a specialist asking for data that
+    is still being prefetched awaits the in-flight request instead of
+    starting a second one.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, _Entry] = {}
+        # Coordinates resolved before planning (lowercased name -> geocoding result)
+        self.locations: dict[str, dict] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Start a fresh report; the cache itself is kept across follow-up runs."""
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+        self.hidden_seconds = 0.0
+
+    async def get_or_run(self, key: str, fetch):
+        entry = self._entries.get(key)
+        now = time.perf_counter()
+        if entry is not None and entry.task.done() and (entry.task.cancelled() or entry.task.exception()):
+            # Never serve a failed fetch, run it again
+            entry = None
+        if entry is None:
+            entry = _Entry(
+                task=asyncio.ensure_future(fetch()),
+                started_at=now,
+                speculative=_speculative.get(),
+            )
+            entry.task.add_done_callback(lambda _, e=entry: setattr(e, "finished_at", time.perf_counter()))
+            self._entries[key] = entry
+            if entry.speculative:
+                self.prefetched += 1
+            else:
+                self.misses += 1
+        elif entry.speculative and not entry.claimed and not _speculative.get():
+            entry.claimed = True
+            self.hits += 1
+            # Time already spent fetching before the agent asked is latency the agent never sees
+            done_at = entry.finished_at if entry.finished_at is not None else now
+            self.hidden_seconds += done_at - entry.started_at
+            logger.info(f"Prefetch cache hit for {key}")
+        return await asyncio.shield(entry.task)
+
+    def add_locations(self, geocoding: dict[str, dict]) -> None:
+        """Share pre-resolved coordinates so weather lookups don't geocode again."""
+        for name, location in geocoding.items():
+            self.locations[_place_name(name)] = location
+            self.locations.setdefault(_place_name(location.get("name") or name), location)
+
+    def resolve(self, location_name: str, country: str | None = None) -> dict | None:
+        """
+        Pre-resolved location for a weather lookup, only when its comma suffix and
+        country agree with it: "Paris, Texas" is not the pre-resolved Paris, France.
+        """
+        location = self.locations.get(_place_name(location_name))
+        if location is None:
+            return None
+        known_country = str(location.get("country") or "").lower()
+        _, _, suffix = location_name.partition(",")
+        for qualifier in (suffix.strip(), country or ""):
+            if qualifier and qualifier.lower() != known_country:
+                return None
+        return location
+
+    async def close(self) -> None:
+        """Cancel prefetches nobody asked for."""
+        for entry in self._entries.values():
+            if not entry.task.done():
+                entry.task.cancel()
+        await asyncio.gather(*(entry.task for entry in self._entries.values()), return_exceptions=True)
+
+    def report(self) -> dict:
+        return {
+            "prefetched": self.prefetched,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hidden_latency_seconds": round(self.hidden_seconds, 3),
+        }
+
+
+def _place_name(location_name: str) -> str:
+    """"Kyoto, Japan" -> "kyoto", the part OpenMeteoTool geocodes by name."""
+    return location_name.split(",")[0].strip().lower()
+
+
+def wikipedia_key(query: str, full_text: bool = False) -> str:
+    return f"wikipedia:{'full' if full_text else 'summary'}:{query.strip().lower()}"
+
+
+def weather_key(location_name: str, start_date=None, end_date=None, *, country: str | None = None,
+                temperature_unit: str = "celsius", location: dict | None = None) -> str:
+    """
+    Cache key of a weather lookup. With the pre-resolved location it resolves to,
+    "Kyoto" and "Kyoto, Japan" share the key; otherwise the full name and country count.
+    """
+    if location is not None:
+        place = f"{location.get('name')}, {location.get('country')}"
+    else:
+        place = ", ".join([part.strip() for part in location_name.split(",")] + ([country] if country else []))
+    start = str(start_date)[:10] if start_date else ""
+    end = str(end_date)[:10] if end_date else ""
+    return f"weather:{place.lower()}:{start}:{end}:{temperature_unit}"
+
+
+def _count_tool_call(tool) -> None:
+    cassette = current_cassette()
+    if cassette is not None and not _speculative.get():
+        cassette.count_tool_call(tool.name)
+
+
+async def _fetch(tool, tool_input, fetch):
+    """Run the real fetch, through the active record/replay cassette if there is one."""
+    cassette = current_cassette()
+    if cassette is None:
+        return await fetch()
+    return await cassette.acall("tool", tool.name, tool_input.model_dump(), fetch)
+
+
+class CachedWikipediaTool(WikipediaTool):
+    """WikipediaTool that reads through a PrefetchCache."""
+
+    def __init__(self, cache: PrefetchCache, options=None, *, language: str = "en"):
+        super().__init__(options, language=language)
+        self.prefetch_cache = cache
+
+    async def clone(self):
+        tool = self.__class__(self.prefetch_cache, options=self.options, language=self._language)
+        tool.name = self.name
+        tool.description = self.description
+        tool.input_schema = self.input_schema
+        tool.client = self.client
+        tool.middlewares.extend(self.middlewares)
+        tool._cache = await self.cache.clone()
+        return tool
+
+    async def _run(self, input, options, context):
+        _count_tool_call(self)
+        return await self.prefetch_cache.get_or_run(
+            wikipedia_key(input.query, input.full_text),
+            lambda: _fetch(self, input, lambda: self._fetch_in_thread(input, options, context)),
+        )
+
+    async def _fetch_in_thread(self, input, options, context):
+        # WikipediaTool._run is async in name only: wikipediaapi fetches with blocking
+        # requests calls, which would stall every other agent on the event loop
+        return await asyncio.to_thread(asyncio.run, super()._run(input, options, context))
+
+
+class CachedOpenMeteoTool(OpenMeteoTool):
+    """OpenMeteoTool that reads through a PrefetchCache and reuses its pre-resolved coordinates."""
+
+    def __init__(self, cache: PrefetchCache, options=None):
+        super().__init__(options)
+        self.prefetch_cache = cache
+
+    async def clone(self):
+        tool = self.__class__(self.prefetch_cache, options=self.options)
+        tool.name = self.name
+        tool.description = self.description
+        tool.input_schema = self.input_schema
+        tool.middlewares.extend(self.middlewares)
+        tool._cache = await self.cache.clone()
+        return tool
+
+    async def _run(self, input, options, context):
+        _count_tool_call(self)
+        key = weather_key(
+            input.location_name, input.start_date, input.end_date,
+            country=input.country,
+            temperature_unit=input.temperature_unit,
+            location=self.prefetch_cache.resolve(input.location_name, input.country),
+        )
+        return await self.prefetch_cache.get_or_run(
+            key, lambda: _fetch(self, input, lambda: super(CachedOpenMeteoTool, self)._run(input, options, context))
+        )
+
+    async def _geocode(self, input):
+        location = self.prefetch_cache.resolve(input.location_name, input.country)
+        if location is None:
+            return await super()._geocode(input)
+        return location
+
+
+async def _prefetch(tool, tool_input: dict) -> None:
+    _speculative.set(True)
+    try:
+        await tool.run(tool_input)
+    except Exception as e:
+        # A failed guess is harmless, the specialist will fetch on its own
+        logger.warning(f"Prefetch of {tool_input} failed: {e}")
+
+
+def start_prefetch(trip: TripQuery, cache: PrefetchCache) -> list[asyncio.Task]:
+    """
+    Speculatively start the Wikipedia and weather fetches the specialists are
+    going to request, as soon as destinations are recognized in the query.
+    """
+    tasks = []
+    wikipedia = CachedWikipediaTool(cache)
+    weather = CachedOpenMeteoTool(cache)
+
+    if trip.needs_destination or trip.needs_culture:
+        topics = list(trip.destinations)
+        if trip.needs_culture:
+            countries = [trip.country_of(city) for city in trip.destinations] or [trip.country]
+            topics += [country for country in dict.fromkeys(countries) if country and country not in topics]
+        for topic in topics:
+            tasks.append(asyncio.create_task(_prefetch(wikipedia, {"query": topic})))
+
+    if trip.needs_weather:
+        for name in trip.destinations:
+            tool_input = {"location_name": name}
+            if trip.start_date:
+                tool_input["start_date"] = trip.start_date.isoformat()
+                tool_input["end_date"] = (trip.end_date or trip.start_date).isoformat()
+            tasks.append(asyncio.create_task(_prefetch(weather, tool_input)))
+
+    logger.info(f"Started {len(tasks)} speculative prefetches")
+    return tasks
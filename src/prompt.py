@@ -1,3 +1,5 @@
+import inspect
+
 from src.exception import CustomException
 from src.logger import logger
 import sys
@@ -54,13 +56,87 @@ travel_coordinator_instruction ="""You are the Travel Coordinator named Atlas, t
         - Language Expert: Language tips, cultural etiquette, and communication guidance
 
         Coordination Process:
-        1. Think about what information is needed for comprehensive travel planning
-        2. Delegate specific queries to appropriate expert agents using handoff tools
-        3. Gather insights from multiple specialists
-        4. Synthesize information into cohesive travel recommendations
-        5. Provide a complete travel planning summary
+        1. The expert agents relevant to the request have already been consulted
+        2. Their reports follow the traveler's request, one section per expert and city
+        3. Synthesize information into cohesive travel recommendations
+        4. Provide a complete travel planning summary
 
         Always ensure travelers receive well-rounded guidance covering destinations and landmarks, weather, and cultural considerations."""
+
+
+multi_city_merge_instruction = """When the expert reports cover several cities, they were researched separately for each city.
+        Merge them into one itinerary that visits the cities in the city order given in the request.
+        Give each city its own part with highlights, weather and cultural notes, add the travel between consecutive cities,
+        and state shared advice (language, etiquette, packing) only once."""
+
+
+# Response profiles for the coordinator: output token budget and section structure
+RESPONSE_PROFILES = {
+    "brief": {
+        "target_tokens": 500,
+        "structure": """Write a brief plan: a 2-3 sentence overview, then at most 6 bullet points with the must-knows
+        (top sights, weather and packing, one key cultural tip). No day-by-day itinerary.
+        End with one line telling the traveler they can expand any section for more detail.""",
+    },
+    "standard": {
+        "target_tokens": 1200,
+        "structure": """Use these sections: Overview, Destinations & Highlights, Weather & Packing, Language & Culture, Practical Tips.
+        Keep each section to a short paragraph or up to 5 bullet points.""",
+    },
+    "detailed": {
+        "target_tokens": 3000,
+        "structure": """Use these sections: Overview, Day-by-Day Itinerary, Destinations & Landmarks, Weather & Packing,
+        Language & Culture (with essential phrases), Transportation, Safety, Practical Tips.""",
+    },
+}
+DEFAULT_RESPONSE_PROFILE = "brief"
+# The answer is returned inside a final_answer tool call, so max_tokens has to fit the
+# JSON envelope and escaping on top of the text, plus answers running past the target
+ANSWER_TOKEN_HEADROOM = 1.5
+ANSWER_TOOL_CALL_TOKENS = 300
+
+
+def response_format(profile: str = DEFAULT_RESPONSE_PROFILE) -> str:
+    """Response structure of the given profile, sent at the end of the coordinator's request."""
+    words = RESPONSE_PROFILES[profile]["target_tokens"] * 3 // 4
+    structure = inspect.cleandoc(RESPONSE_PROFILES[profile]["structure"])
+    return f"Response format (at most about {words} words):\n{structure}"
+
+
+def answer_max_tokens(profile: str = DEFAULT_RESPONSE_PROFILE) -> int:
+    """max_tokens for an answer in the given profile, with headroom above its target length."""
+    return int(RESPONSE_PROFILES[profile]["target_tokens"] * ANSWER_TOKEN_HEADROOM) + ANSWER_TOOL_CALL_TOKENS
+
+
+expand_section_instruction = """Expand the {title} part of the travel plan for {scope}.
+        Use only the expert report below, do not repeat the rest of the plan.
+
+{report}"""
+
+
+followup_question_instruction = """Answer the traveler's follow-up question about this trip: {question}
+        Use only the expert reports below, do not repeat the rest of the plan.
+
+Expert reports:
+
+{reports}"""
+
+
+# Static system prompts per agent. They never contain per-request data (that goes
+# into the user message), so the role and instructions at the top of the system
+# prompt stay byte-identical across runs. The framework sends only the tools allowed
+# at each step and lists their state after the instructions, so whether the provider
+# caches anything beyond that is measured by `python -m src.prompt_cache`.
+SYSTEM_INSTRUCTIONS = {
+    "destination": inspect.cleandoc(destination_expert_instruction),
+    "weather": inspect.cleandoc(travel_meteorologist_instruction),
+    "culture": inspect.cleandoc(lang_and_cultural_expert_instruction),
+    "coordinator": "\n\n".join([
+        inspect.cleandoc(travel_coordinator_instruction),
+        inspect.cleandoc(multi_city_merge_instruction),
+        "Always follow the response format given at the end of the request.",
+    ]),
+}
         
         
         
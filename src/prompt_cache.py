@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logger
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough to compare prompt parts."""
+    return max(1, round(len(text) / 4)) if text else 0
+
+
+def tool_schema_text(tools) -> str:
+    """Serialize tool schemas deterministically, in the order the agent receives them."""
+    schemas = []
+    for tool in tools:
+        schemas.append(json.dumps(
+            {
+                "name": tool.name,
+                "description": tool.description,
+                "parameters": tool.input_schema.model_json_schema(),
+            },
+            sort_keys=True,
+        ))
+    return "\n".join(schemas)
+
+
+@dataclass
+class _AgentUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_prompt_tokens: int = 0
+
+
+class PromptCacheStats:
+    """Per-agent prompt and cached-prompt token counts, read from the LLM usage of every call."""
+
+    def __init__(self):
+        self.agents: dict[str, _AgentUsage] = {}
+
+    def track(self, llm, agent_name: str) -> None:
+        """Count the usage of every successful call made through this llm instance."""
+        usage = self.agents.setdefault(agent_name, _AgentUsage())
+
+        def on_success(data, event) -> None:
+            output_usage = getattr(data.value, "usage", None)
+            if output_usage is None:
+                return
+            usage.calls += 1
+            usage.prompt_tokens += output_usage.prompt_tokens or 0
+            usage.cached_prompt_tokens += getattr(output_usage, "cached_prompt_tokens", 0) or 0
+
+        llm.emitter.on("success", on_success)
+
+    def report(self) -> dict:
+        report = {}
+        for name, usage in self.agents.items():
+            ratio = usage.cached_prompt_tokens / usage.prompt_tokens if usage.prompt_tokens else 0.0
+            report[name] = {
+                "calls": usage.calls,
+                "prompt_tokens": usage.prompt_tokens,
+                "cached_prompt_tokens": usage.cached_prompt_tokens,
+                "cached_ratio": round(ratio, 3),
+            }
+        return report
+
+
+# OpenAI only caches prompts from this many tokens on
+PROVIDER_MIN_CACHEABLE_TOKENS = 1024
+
+
+async def render_system_prompts(agent, max_steps: int = 6) -> list[tuple[str, list]]:
+    """
+    Render the agent's real system prompt, and the tools it may call, at each
+    step of a typical run: the agent's own requirements decide what is allowed,
+    and each step calls the first allowed tool until only the final answer is.
+    Uses the framework's own request and system message builders.
+    """
+    from beeai_framework.agents.requirement.types import RequirementAgentRunState, RequirementAgentRunStateStep
+    from beeai_framework.agents.requirement.utils._llm import RequirementsReasoner, _create_system_message
+    from beeai_framework.agents.requirement.utils._tool import FinalAnswerTool
+    from beeai_framework.context import RunContext
+    from beeai_framework.memory import UnconstrainedMemory
+    from beeai_framework.tools import StringToolOutput
+
+    state = RequirementAgentRunState(answer=None, result=None, memory=UnconstrainedMemory(), steps=[], iteration=0)
+    reasoner = RequirementsReasoner(
+        tools=agent.meta.tools, final_answer=FinalAnswerTool(None, state=state), context=RunContext(agent, signal=None)
+    )
+    await reasoner.update(agent._requirements)
+    renders = []
+    for step in range(max_steps):
+        request = await reasoner.create_request(state, force_tool_call=True)
+        system = _create_system_message(template=agent._templates.system, request=request)
+        renders.append((system.text, list(request.allowed_tools)))
+        tool = next((tool for tool in request.allowed_tools if tool is not request.final_answer), None)
+        if tool is None:
+            break
+        state.steps.append(RequirementAgentRunStateStep(
+            id=str(step), iteration=step, tool=tool, input={}, output=StringToolOutput(""), error=None
+        ))
+        state.iteration += 1
+    return renders
+
+
+def measure_prompt_layout(renders: list[tuple[str, list]]) -> dict:
+    """
+    Cacheability of one agent's prompts across the steps of a run, from
+    render_system_prompts. The provider caches a prefix only when the tool
+    definitions sent with the request are identical too, and only from
+    PROVIDER_MIN_CACHEABLE_TOKENS on.
+    """
+    try:
+        prompts = [text for text, _ in renders]
+        tool_sets = {tuple(tool.name for tool in tools) for _, tools in renders}
+        shared = os.path.commonprefix(prompts)
+        # Cut at the last complete line, a partial line is no stable boundary
+        shared = shared[:shared.rfind("\n") + 1]
+        tool_tokens = max(estimate_tokens(tool_schema_text(tools)) for _, tools in renders)
+        shared_tokens = estimate_tokens(shared) + (tool_tokens if len(tool_sets) == 1 else 0)
+        return {
+            "steps": len(renders),
+            "system_prompt_tokens": max(estimate_tokens(prompt) for prompt in prompts),
+            "shared_prefix_tokens": estimate_tokens(shared),
+            "tool_schema_tokens": tool_tokens,
+            "tool_sets": len(tool_sets),
+            "cacheable_prefix_tokens": shared_tokens,
+            "meets_provider_minimum": shared_tokens >= PROVIDER_MIN_CACHEABLE_TOKENS,
+        }
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+async def measure_agents(agents: dict) -> dict:
+    return {name: measure_prompt_layout(await render_system_prompts(agent)) for name, agent in agents.items()}
+
+
+if __name__ == "__main__":
+    # python -m src.prompt_cache  (from the repo root)
+    import asyncio
+
+    from agent import build_agents
+
+    # Rendering prompts never reaches the provider, but building the model expects a key
+    os.environ.setdefault("OPENAI_API_KEY", "measure")
+    report = asyncio.run(measure_agents(build_agents()))
+    logger.info(f"Prompt layout report: {report}")
+    for name, values in report.items():
+        print(f"{name:12} {values['steps']} steps, system prompt ~{values['system_prompt_tokens']} tokens, "
+              f"shared across steps ~{values['shared_prefix_tokens']}, tool schemas ~{values['tool_schema_tokens']} "
+              f"({values['tool_sets']} distinct sets)")
+        if not values["meets_provider_minimum"]:
+            print(f"{'':12} cacheable prefix ~{values['cacheable_prefix_tokens']} tokens is below the provider's "
+                  f"{PROVIDER_MIN_CACHEABLE_TOKENS}-token minimum, it won't be cached")
@@ -0,0 +1,431 @@
+import asyncio
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from functools import lru_cache
+
+import requests
+
+from src.cassette import current_cassette
+from src.exception import CustomException
+from src.logger import logger
+
+
+# Specialist keys used across the planner (see agent.py)
+DESTINATION = "destination"
+WEATHER = "weather"
+CULTURE = "culture"
+ALL_SPECIALISTS = (DESTINATION, WEATHER, CULTURE)
+
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+
+_WEATHER_KEYWORDS = (
+    "weather", "forecast", "rain", "temperature", "climate", "sunny", "snow",
+    "humid", "pack", "packing", "hot", "cold", "storm", "wind",
+)
+_CULTURE_KEYWORDS = (
+    "culture", "cultural", "language", "phrase", "etiquette", "custom",
+    "locals", "tipping", "speak", "respectful", "tradition", "traditional",
+    "religion", "religious", "festival", "greeting",
+)
+_DESTINATION_KEYWORDS = (
+    "attraction", "sights", "landmark", "things to do", "see", "visit",
+    "historical", "museum", "transport", "transportation", "safety", "safe",
+    "hotel", "stay",
+    "where to", "neighborhood", "neighbourhood",
+)
+# Queries asking for a whole plan need every specialist
+_BROAD_KEYWORDS = (
+    "plan", "itinerary", "trip", "everything", "what should i know",
+    "first-time", "first time",
+)
+
+_INTEREST_KEYWORDS = {
+    "history": ("history", "historical", "ancient", "castle", "temple", "ruins"),
+    "culture": ("culture", "cultural", "tradition", "locals"),
+    "food": ("food", "cuisine", "restaurant", "eat", "street food", "dining"),
+    "art": ("art", "museum", "gallery"),
+    "nature": ("nature", "hiking", "mountain", "park", "outdoor"),
+    "beaches": ("beach", "island", "coast", "swim"),
+    "nightlife": ("nightlife", "bar", "club"),
+    "shopping": ("shopping", "market", "shop"),
+}
+
+_MONTHS = {
+    name: index
+    for index, name in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"],
+        start=1,
+    )
+}
+
+# Capitalized words that look like places but are not
+_NOT_PLACES = {
+    "I", "I'm", "I'd", "I'll", "What", "Where", "When", "How", "Which", "Can",
+    "Could", "Should", "Please", "Tell", "Give", "Is", "Are", "Do", "The", "A",
+    "An", "My", "We", "Our", "Monday", "Tuesday", "Wednesday", "Thursday",
+    "Friday", "Saturday", "Sunday",
+    # Seasons and holidays ("in Spring", "for New Year")
+    "Spring", "Summer", "Autumn", "Fall", "Winter", "New Year", "New Year's",
+    "New Years", "Christmas", "Easter", "Thanksgiving", "Halloween", "Ramadan",
+    "Golden Week", "Cherry Blossom", "Cherry Blossoms",
+} | {month.capitalize() for month in _MONTHS}
+
+# Nationality and language adjectives ("in Japanese", "of Italian customs") that
+# the suffix rule in _is_demonym doesn't catch. The "-ian" ones are listed
+# instead of matched by suffix, which would also drop cities such as Dalian.
+_DEMONYMS = {
+    "French", "Dutch", "German", "Greek", "Thai", "Swiss", "Czech", "Welsh",
+    "Irish", "Scottish", "English", "British", "American", "Mexican", "Korean",
+    "Moroccan", "Cuban", "Peruvian", "Turkish", "Arab", "Arabic", "Hebrew",
+    "Latin", "Hindi", "Mandarin", "Swahili", "Filipino", "Kiwi", "European",
+    "Asian", "African", "Catalan", "Basque", "Maori",
+    "Italian", "Indian", "Russian", "Canadian", "Australian", "Brazilian",
+    "Egyptian", "Norwegian", "Hungarian", "Austrian", "Belgian", "Croatian",
+    "Indonesian", "Malaysian", "Persian", "Iranian", "Colombian", "Argentinian",
+    "Romanian", "Bulgarian", "Serbian", "Ukrainian", "Hawaiian", "Georgian",
+    "Armenian", "Syrian", "Tunisian", "Algerian", "Nigerian", "Ethiopian",
+    "Jordanian", "Cambodian", "Mongolian", "Bolivian", "Estonian", "Latvian",
+    "Lithuanian", "Slovenian", "Slovakian", "Bosnian", "Albanian", "Macedonian",
+    "Scandinavian", "Mediterranean", "Caribbean", "Bavarian", "Sicilian",
+    "Tuscan", "Venetian", "Parisian", "Balinese",
+}
+
+# Lowercase words after a preposition that never start a place name
+_LOWERCASE_STOPWORDS = {
+    "a", "an", "the", "my", "our", "your", "this", "that", "these", "those",
+    "next", "last", "each", "every", "some", "any", "all", "it", "them", "me",
+    "us", "there", "here", "see", "do", "go", "get", "know", "find", "visit",
+    "explore", "stay", "eat", "travel", "plan", "trip", "weather", "culture",
+    "local", "locals", "days", "weeks", "day", "week", "weekend", "month",
+    "year", "summer", "spring", "autumn", "fall", "winter", "march", "may",
+    "and", "or", "with", "about", "what", "when", "how", "which", "should",
+    "i", "we", "be", "is", "are", "was", "mind", "general", "advance", "case",
+    "time", "order", "addition", "person", "total", "detail", "details",
+    "tomorrow", "today", "tonight", "two", "three", "four", "five", "one",
+} | set(_MONTHS)
+
+_PREPOSITIONS = (
+    r"to|in|visit|visiting|around|about|explore|exploring|from|for|of|add|include|drop|remove|skip"
+)
+_PLACE = r"[A-Z][\w'\-]+(?:\s+[A-Z][\w'\-]+)*"
+_PLACE_AFTER_PREPOSITION = re.compile(
+    rf"\b(?i:{_PREPOSITIONS})\s+"
+    rf"({_PLACE}(?:\s*(?:,|and|&)\s*{_PLACE})*)"
+)
+# Fallback for all-lowercase queries ("weather in rome next week"), validated by geocoding
+_LOWERCASE_PLACE_AFTER_PREPOSITION = re.compile(
+    rf"\b(?:{_PREPOSITIONS})\s+([a-z][a-z'\-]+(?:\s+[a-z][a-z'\-]+)?)"
+)
+# Only parentheses listing places count, "Tokyo and Osaka (2 weeks)" is left to the preposition pass
+_PLACE_WITH_CITIES = re.compile(
+    rf"({_PLACE})\s*\(\s*({_PLACE}(?:\s*(?:,|and|&)\s*{_PLACE})*)\s*\)"
+)
+_ISO_DATE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_DURATION = re.compile(r"\b(\d+)[\s\-]*(day|days|night|nights|week|weeks)\b", re.IGNORECASE)
+_IN_N_DAYS = re.compile(r"\bin\s+(\d+)\s+days?\b", re.IGNORECASE)
+_MONTH_DAY = re.compile(
+    r"\b(" + "|".join(_MONTHS) + r")\s+(\d{1,2})(?:st|nd|rd|th)?\b", re.IGNORECASE
+)
+_IN_MONTH = re.compile(r"\b(?:in|during)\s+(" + "|".join(_MONTHS) + r")\b", re.IGNORECASE)
+
+
+@dataclass
+class TripQuery:
+    """Intent and entities extracted locally from a traveler's request."""
+    text: str
+    destinations: list[str] = field(default_factory=list)
+    country: str | None = None
+    start_date: date | None = None
+    end_date: date | None = None
+    interests: list[str] = field(default_factory=list)
+    needs_destination: bool = True
+    needs_weather: bool = True
+    needs_culture: bool = True
+    geocoding: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def specialists(self) -> list[str]:
+        """Specialists that have to run to answer this query."""
+        flags = {
+            DESTINATION: self.needs_destination,
+            WEATHER: self.needs_weather,
+            CULTURE: self.needs_culture,
+        }
+        return [name for name in ALL_SPECIALISTS if flags[name]]
+
+    def country_of(self, city: str) -> str | None:
+        """Country of a destination from its geocoding, else the trip's country."""
+        location = self.geocoding.get(city) or {}
+        return location.get("country") or self.country
+
+    def to_context(self) -> str:
+        """Render the extracted details so agents don't have to re-derive them."""
+        lines = []
+        for name in self.destinations:
+            location = self.geocoding.get(name)
+            if location:
+                lines.append(
+                    f"- Destination: {location['name']}, {location.get('country', '')} "
+                    f"(latitude {location['latitude']}, longitude {location['longitude']})"
+                )
+            else:
+                lines.append(f"- Destination: {name}")
+        if self.country and self.country not in self.destinations:
+            lines.append(f"- Country: {self.country}")
+        if self.start_date:
+            end = self.end_date or self.start_date
+            lines.append(f"- Dates: {self.start_date.isoformat()} to {end.isoformat()}")
+        if self.interests:
+            lines.append(f"- Interests: {', '.join(self.interests)}")
+        if not lines:
+            return ""
+        return "Pre-parsed trip details:\n" + "\n".join(lines)
+
+
+def _contains_any(text: str, keywords) -> bool:
+    """Whole-word (optionally plural) keyword match, so "hotel" doesn't count as "hot"."""
+    return any(re.search(rf"\b{re.escape(keyword)}(?:s|es)?\b", text) for keyword in keywords)
+
+
+def _is_demonym(word: str) -> bool:
+    """Nationality/language adjectives such as "Japanese", "Italian" or "Spanish"."""
+    return word in _DEMONYMS or word.endswith(("ese", "ish"))
+
+
+def _is_place_candidate(name: str) -> bool:
+    words = name.split()
+    if not words or any(_is_demonym(word) for word in words):
+        return False
+    # "Chinese New Year", "Late Spring": reject when any trailing part is not a place
+    return not any(" ".join(words[i:]) in _NOT_PLACES for i in range(len(words)))
+
+
+def _split_places(chunk: str) -> list[str]:
+    parts = re.split(r"\s*(?:,|\band\b|&)\s*", chunk)
+    return [part.strip() for part in parts if _is_place_candidate(part.strip())]
+
+
+def _lowercase_places(text: str) -> list[str]:
+    """Title-cased candidates after prepositions in a query typed without capitals."""
+    places = []
+    for match in _LOWERCASE_PLACE_AFTER_PREPOSITION.finditer(text):
+        words = match.group(1).split()
+        if words[0] in _LOWERCASE_STOPWORDS or not _is_place_candidate(" ".join(words).title()):
+            continue
+        if len(words) > 1 and words[1] in _LOWERCASE_STOPWORDS:
+            words = words[:1]
+        name = " ".join(words).title()
+        if _is_place_candidate(name):
+            places.append(name)
+    return places
+
+
+def _country_name(name: str) -> str | None:
+    """"Visit New Zealand" -> "New Zealand": drop the capitalized words that lead into the name."""
+    words = name.split()
+    while words and (words[0].lower() in _LOWERCASE_STOPWORDS or words[0] in _NOT_PLACES):
+        words = words[1:]
+    return " ".join(words) or None
+
+
+def extract_destinations(text: str) -> tuple[list[str], str | None]:
+    """
+    Return (candidate destinations, country) found in the query text.
+    Candidates are only a guess, prefill_geocoding drops the ones that don't
+    geocode to a real place.
+    """
+    destinations: list[str] = []
+    country = None
+
+    # "Japan (Tokyo and Osaka)" -> country Japan, cities Tokyo and Osaka
+    for match in _PLACE_WITH_CITIES.finditer(text):
+        cities = _split_places(match.group(2))
+        if cities:
+            country = _country_name(match.group(1))
+            destinations.extend(cities)
+
+    if not destinations:
+        for match in _PLACE_AFTER_PREPOSITION.finditer(text):
+            destinations.extend(_split_places(match.group(1)))
+
+    if not destinations:
+        destinations.extend(_lowercase_places(text.lower()))
+
+    unique = []
+    for name in destinations:
+        if name not in unique:
+            unique.append(name)
+    return unique, country
+
+
+def extract_dates(text: str, today: date | None = None) -> tuple[date | None, date | None]:
+    """Return the (start, end) travel dates implied by the query, if any."""
+    today = today or date.today()
+    lowered = text.lower()
+    start = end = None
+
+    iso_dates = [date.fromisoformat(value) for value in _ISO_DATE.findall(text)]
+    month_days = []
+    for month, day in _MONTH_DAY.findall(text):
+        try:
+            candidate = date(today.year, _MONTHS[month.lower()], int(day))
+        except ValueError:
+            continue
+        if candidate < today:
+            candidate = candidate.replace(year=today.year + 1)
+        month_days.append(candidate)
+
+    explicit = iso_dates or month_days
+    if explicit:
+        start, end = explicit[0], explicit[-1]
+    elif "tomorrow" in lowered:
+        start = today + timedelta(days=1)
+    elif "today" in lowered:
+        start = today
+    elif "this weekend" in lowered:
+        start = today + timedelta(days=(5 - today.weekday()) % 7)
+        end = start + timedelta(days=1)
+    elif "next week" in lowered:
+        start = today + timedelta(days=7 - today.weekday())
+        end = start + timedelta(days=6)
+    elif "next month" in lowered:
+        first = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+        start = first
+    elif match := _IN_N_DAYS.search(text):
+        start = today + timedelta(days=int(match.group(1)))
+    elif match := _IN_MONTH.search(text):
+        month = _MONTHS[match.group(1).lower()]
+        year = today.year if month >= today.month else today.year + 1
+        start = date(year, month, 1)
+
+    if start and (end is None or end == start):
+        days = extract_duration(text)
+        if days:
+            end = start + timedelta(days=days - 1)
+    return start, end
+
+
+def extract_duration(text: str) -> int | None:
+    """Trip length in days when the query states one ("10 days", "2-week")."""
+    duration = _DURATION.search(text)
+    if not duration:
+        return None
+    days = int(duration.group(1))
+    if duration.group(2).lower().startswith("week"):
+        days *= 7
+    return days
+
+
+def extract_interests(text: str) -> list[str]:
+    lowered = text.lower()
+    return [
+        interest
+        for interest, keywords in _INTEREST_KEYWORDS.items()
+        if _contains_any(lowered, keywords)
+    ]
+
+
+def detect_needs(text: str) -> list[str]:
+    """Specialists the text explicitly asks for, without any broad-query fallback."""
+    lowered = text.lower()
+    flags = {
+        DESTINATION: _contains_any(lowered, _DESTINATION_KEYWORDS),
+        WEATHER: _contains_any(lowered, _WEATHER_KEYWORDS),
+        CULTURE: _contains_any(lowered, _CULTURE_KEYWORDS),
+    }
+    return [name for name in ALL_SPECIALISTS if flags[name]]
+
+
+def parse_query(text: str, today: date | None = None) -> TripQuery:
+    """
+    Fast local intent/entity extraction that runs before any LLM call.
+    Narrow questions (e.g. only about the weather) select a single specialist,
+    broad planning requests keep all of them.
+    """
+    try:
+        lowered = text.lower()
+        destinations, country = extract_destinations(text)
+        start_date, end_date = extract_dates(text, today=today)
+
+        needs = detect_needs(text)
+        # A single focused need wins over generic "trip"/"plan" wording
+        if not needs or (len(needs) > 1 and _contains_any(lowered, _BROAD_KEYWORDS)):
+            needs = list(ALL_SPECIALISTS)
+
+        trip = TripQuery(
+            text=text,
+            destinations=destinations,
+            country=country,
+            start_date=start_date,
+            end_date=end_date,
+            interests=extract_interests(text),
+            needs_destination=DESTINATION in needs,
+            needs_weather=WEATHER in needs,
+            needs_culture=CULTURE in needs,
+        )
+        logger.info(f"Parsed query: destinations={trip.destinations} specialists={trip.specialists}")
+        return trip
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def geocode(name: str, timeout: float = 2.0) -> dict | None:
+    """
+    Resolve a place name with the Open-Meteo geocoding API (same source OpenMeteoTool uses).
+    Returns None for unknown places; network errors raise and are not cached.
+    """
+    cassette = current_cassette()
+    if cassette is not None:
+        return cassette.call("geocode", GEOCODING_URL, name, lambda: _geocode(name, timeout))
+    return _geocode(name, timeout)
+
+
+@lru_cache(maxsize=256)
+def _geocode(name: str, timeout: float) -> dict | None:
+    # lru_cache doesn't store exceptions, so a failed lookup is retried next time
+    response = requests.get(
+        GEOCODING_URL,
+        params={"name": name, "count": 1, "language": "en", "format": "json"},
+        timeout=timeout,
+    )
+    response.raise_for_status()
+    results = response.json().get("results") or []
+    if not results:
+        return None
+    location = results[0]
+    return {
+        "name": location.get("name", name),
+        "country": location.get("country"),
+        "latitude": location.get("latitude"),
+        "longitude": location.get("longitude"),
+        "timezone": location.get("timezone"),
+    }
+
+
+async def prefill_geocoding(trip: TripQuery) -> TripQuery:
+    """
+    Geocode all candidate destinations concurrently, attach the results to the
+    trip and drop the candidates that are not a real place. Candidates whose
+    lookup failed are kept unverified rather than dropped.
+    """
+    names = [name for name in trip.destinations if name not in trip.geocoding]
+    results = await asyncio.gather(
+        *(asyncio.to_thread(geocode, name) for name in names), return_exceptions=True
+    )
+    unknown = []
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Geocoding failed for {name}: {result}")
+        elif result is None:
+            unknown.append(name)
+        else:
+            trip.geocoding[name] = result
+            if trip.country is None:
+                trip.country = result.get("country")
+    if unknown:
+        logger.info(f"Dropped destination candidates that don't geocode: {unknown}")
+        trip.destinations = [name for name in trip.destinations if name not in unknown]
+    return trip
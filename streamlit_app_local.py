@@ -8,6 +8,7 @@ import threading
 import queue
 import builtins
 import importlib
+import uuid
 from unittest.mock import patch, MagicMock
 from dotenv import load_dotenv
 
@@ -61,15 +62,19 @@ try:
         del sys.modules['agent']
     
     import agent
-    from agent import multi_agent_travel_planner_with_language
+    from agent import multi_agent_travel_planner_with_language, admitted_travel_planner, admitted_expand_section
+    from src.admission import NORMAL, AdmissionRejected, admission_controller, start_metrics_server
+    from src.prompt import RESPONSE_PROFILES, DEFAULT_RESPONSE_PROFILE
     logger.info("Successfully reloaded agent module.")
+    # Prometheus endpoint for the admission metrics when ADMISSION_METRICS_PORT is set
+    start_metrics_server()
 except ImportError:
     st.error("⚠️ Could not find 'agent.py'. Please ensure it is in the same directory.")
     st.stop()
 
 # --- Custom Agent Runner ---
 class AgentRunner:
-    def __init__(self):
+    def __init__(self, user_id):
         self.output_queue = queue.Queue() # Response from UI -> Agent
         self.result_queue = queue.Queue() # Final result from Agent
         self.error_queue = queue.Queue()  # Errors
@@ -79,6 +84,10 @@ class AgentRunner:
         self.is_running = False
         self.waiting_for_input = False
         self.pending_request = None # Stores the prompt text (e.g., "Allow tool X?")
+        self.plan = None # Structured plan of the last run, used to replan follow-ups incrementally
+        self.profile = DEFAULT_RESPONSE_PROFILE # Answer length: brief / standard / detailed
+        self.user_id = user_id # Admission quotas are tracked per session
+        self.priority = NORMAL
 
     def start(self, user_prompt):
         """Starts the agent in a separate daemon thread."""
@@ -128,31 +137,54 @@ class AgentRunner:
                     mock_stdin.readline.side_effect = self._custom_input
                     
                     # Run the agent
-                    response = asyncio.run(multi_agent_travel_planner_with_language(user_prompt))
+                    plan = asyncio.run(admitted_travel_planner(
+                        user_prompt, self.user_id, self.priority,
+                        previous_plan=self.plan, return_plan=True, profile=self.profile
+                    ))
                     
-                    if response is None:
+                    if plan is None:
                         msg = "⚠️ Agent returned `None`. Did you add `return` to the end of `agent.py`?"
                         logger.error(msg)
                         response = msg
                     else:
+                        # Cached answers (served under overload) have no sections to build follow-ups on
+                        if plan.sections:
+                            self.plan = plan
+                        response = plan.answer
                         logger.info("Agent finished successfully.")
                     
                     self.result_queue.put(response)
                     
+        except AdmissionRejected as e:
+            logger.warning(f"Plan not admitted: {str(e)}")
+            self.result_queue.put(f"⏳ {str(e)}")
         except Exception as e:
             logger.error(f"Agent thread failed: {str(e)}")
             self.error_queue.put(str(e))
         finally:
             self.is_running = False
 
+    def expand(self, index):
+        """Detailed version of one plan section, admitted like a plan run; returns the chat message."""
+        try:
+            return asyncio.run(admitted_expand_section(self.plan, index, self.user_id, self.priority))
+        except AdmissionRejected as e:
+            logger.warning(f"Expansion not admitted: {str(e)}")
+            return f"⏳ {str(e)}"
+        except Exception as e:
+            logger.error(f"Section expansion failed: {str(e)}")
+            return f"❌ Error: {str(e)}"
+
     def send_approval(self, approved: bool):
         """Called by UI to send answer to agent."""
         response = "y" if approved else "n"
         self.output_queue.put(response)
 
 # --- Initialize Session State ---
+if "user_id" not in st.session_state:
+    st.session_state.user_id = str(uuid.uuid4())
 if "runner" not in st.session_state:
-    st.session_state.runner = AgentRunner()
+    st.session_state.runner = AgentRunner(st.session_state.user_id)
 if "messages" not in st.session_state:
     st.session_state.messages = [{
         "role": "assistant",
@@ -164,8 +196,16 @@ with st.sidebar:
     st.header("Agent Settings")
     # st.info("Human-in-the-loop disabled.")
     
-    # Status Indicator
     runner = st.session_state.runner
+    profiles = list(RESPONSE_PROFILES)
+    runner.profile = st.selectbox(
+        "Response length",
+        profiles,
+        index=profiles.index(runner.profile),
+        help="Brief answers arrive fastest, expand any section afterwards for details.",
+    )
+    
+    # Status Indicator
     if runner.is_running:
         if runner.waiting_for_input:
             st.warning("⚠️ Waiting for your input")
@@ -174,9 +214,12 @@ with st.sidebar:
     else:
         st.write("💤 Agent is idle")
 
+    with st.expander("Admission metrics"):
+        st.json(admission_controller.metrics())
+
     if st.button("Clear Chat History", type="primary"):
         st.session_state.messages = []
-        st.session_state.runner = AgentRunner()
+        st.session_state.runner = AgentRunner(st.session_state.user_id)
         st.rerun()
 
 # --- Main Interface ---
@@ -230,6 +273,17 @@ if not runner.error_queue.empty():
     st.session_state.messages.append({"role": "assistant", "content": f"❌ Error: {error_msg}"})
     st.rerun()
 
+# 2b. Expandable plan sections (generated on demand from the stored specialist reports)
+if not runner.is_running and runner.plan is not None and runner.plan.sections:
+    with st.expander("🔎 Expand a section of the plan"):
+        for index, section in enumerate(runner.plan.sections):
+            scope = ", ".join(section.cities) or "whole trip"
+            if st.button(f"{section.specialist.title()} ({scope})", key=f"expand_{index}"):
+                with st.spinner("Writing the detailed section..."):
+                    detail = runner.expand(index)
+                st.session_state.messages.append({"role": "assistant", "content": detail})
+                st.rerun()
+
 # 3. Handle New User Input
 if not runner.is_running and (prompt := st.chat_input("If you are unsure how to phrase your request, please ask me for a detailed prompt example")):
     with st.chat_message("user"):
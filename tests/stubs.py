@@ -0,0 +1,144 @@
+"""
+Stubbed LLM, tool and geocoding backends for recording the committed cassettes
+without API keys or network access:
+
+    python -m tests.stubs [scenario ...]    # from the repo root
+
+Records the regression scenarios under the stubs and stores their metrics as
+the baselines. The stub model walks through each agent's tools the way its
+requirements allow (think, fetch, answer), so the cassettes exercise the real
+orchestration: pre-parsing, prefetch, per-city fan-out, patching and synthesis.
+`python -m src.regression record` replaces them with live recordings.
+"""
+import asyncio
+import json
+import re
+import sys
+from contextlib import ExitStack
+from unittest import mock
+
+from beeai_framework.backend import AssistantMessage, ChatModelOutput, MessageToolCallContent, UserMessage
+from beeai_framework.backend.types import ChatModelUsage
+from beeai_framework.tools import JSONToolOutput, Tool
+from beeai_framework.tools.search.wikipedia import WikipediaTool, WikipediaToolOutput
+from beeai_framework.tools.search.wikipedia.wikipedia import WikipediaToolResult
+from beeai_framework.tools.weather import OpenMeteoTool
+
+from src.prompt_cache import estimate_tokens
+
+
+LOCATIONS = {
+    "Tokyo": ("Japan", 35.69, 139.69),
+    "Osaka": ("Japan", 34.69, 135.50),
+    "Rome": ("Italy", 41.89, 12.51),
+    "Florence": ("Italy", 43.77, 11.25),
+    "Venice": ("Italy", 45.44, 12.33),
+}
+
+
+def stub_geocode(name: str, timeout: float) -> dict | None:
+    if name not in LOCATIONS:
+        return None
+    country, latitude, longitude = LOCATIONS[name]
+    return {"name": name, "country": country, "latitude": latitude, "longitude": longitude, "timezone": "UTC"}
+
+
+async def stub_wikipedia(self, input, options, context):
+    return WikipediaToolOutput([WikipediaToolResult(
+        title=input.query,
+        description=f"{input.query} is a popular travel destination with a long history.",
+        url=f"https://en.wikipedia.org/wiki/{input.query.replace(' ', '_')}",
+    )])
+
+
+async def stub_weather(self, input, options, context):
+    return JSONToolOutput({
+        "location": input.location_name,
+        "daily": {"temperature_2m_max": [21.0], "temperature_2m_min": [12.0], "rain_sum": [0.4]},
+    })
+
+
+def _focus(text: str) -> tuple[str, str | None, str | None]:
+    """(city, start, end) the agent's query is about, from the pre-parsed trip details."""
+    focus = re.search(r"Focus only on: ([^,.\n]+)", text)
+    destination = re.search(r"- Destination: ([^,(\n]+)", text)
+    dates = re.search(r"- Dates: (\S+) to (\S+)", text)
+    city = (focus or destination).group(1).strip() if focus or destination else "the destination"
+    return city, dates and dates.group(1), dates and dates.group(2)
+
+
+def _tool_input(tool: Tool, city: str, start: str | None, end: str | None) -> dict:
+    if tool.name == "think":
+        return {"thoughts": f"Gather what the traveler needs for {city}."}
+    if isinstance(tool, WikipediaTool):
+        return {"query": city}
+    if isinstance(tool, OpenMeteoTool):
+        return {"location_name": city, **({"start_date": start, "end_date": end} if start else {})}
+    return {"response": f"Stub answer about {city}: weather, sights and customs in a few sentences."}
+
+
+def _answer(chat_input) -> ChatModelOutput:
+    """Call the forced tool, else the first allowed tool not used yet, else answer."""
+    text = next(message.text for message in chat_input.messages if isinstance(message, UserMessage))
+    used = {
+        content.tool_name
+        for message in chat_input.messages if isinstance(message, AssistantMessage)
+        for content in message.get_tool_calls()
+    }
+    tools = chat_input.tools or []
+    if isinstance(chat_input.tool_choice, Tool):
+        tool = chat_input.tool_choice
+    else:
+        unused = [tool for tool in tools if tool.name not in used and tool.name != "final_answer"]
+        tool = unused[0] if unused else next(tool for tool in tools if tool.name == "final_answer")
+    args = json.dumps(_tool_input(tool, *_focus(text)))
+    prompt = sum(estimate_tokens(message.text) for message in chat_input.messages)
+    return ChatModelOutput(
+        output=[AssistantMessage([MessageToolCallContent(id=f"call_{len(chat_input.messages)}", tool_name=tool.name, args=args)])],
+        usage=ChatModelUsage(prompt_tokens=prompt, completion_tokens=estimate_tokens(args), total_tokens=prompt + estimate_tokens(args)),
+        finish_reason="tool_calls",
+    )
+
+
+def stubbed():
+    """Patch the model, tool and geocoding backends; use as a context manager."""
+    import agent
+
+    real_build_llm = agent.build_llm
+
+    def build_llm(max_tokens: int | None = None):
+        llm = real_build_llm(max_tokens=max_tokens)
+
+        async def create(chat_input, run):
+            return _answer(chat_input)
+
+        async def create_stream(chat_input, run):
+            yield _answer(chat_input)
+
+        llm._create = create
+        llm._create_stream = create_stream
+        return llm
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.dict("os.environ", {"OPENAI_API_KEY": "stub"}))
+    stack.enter_context(mock.patch.object(agent, "build_llm", build_llm))
+    stack.enter_context(mock.patch("src.query_parser._geocode", stub_geocode))
+    stack.enter_context(mock.patch.object(WikipediaTool, "_run", stub_wikipedia))
+    stack.enter_context(mock.patch.object(OpenMeteoTool, "_run", stub_weather))
+    return stack
+
+
+def main(scenarios: list[str]) -> int:
+    from src import regression
+    from src.cassette import RECORD
+
+    scenarios = scenarios or list(regression.SCENARIOS)
+    with stubbed():
+        for scenario in scenarios:
+            metrics, _ = asyncio.run(regression.run_scenario(scenario, RECORD))
+            print(f"{scenario}: recorded {metrics['llm_calls']} LLM and {metrics['tool_calls']} tool calls")
+    return regression.main(["baseline", *scenarios])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from src import admission
+from src.admission import HIGH, LOW, AdmissionController, AdmissionRejected
+
+
+def busy_controller(**kwargs) -> tuple[AdmissionController, object]:
+    """Controller whose only slot is taken and whose queue has no room."""
+    controller = AdmissionController(max_in_flight=1, max_queue=0, **kwargs)
+    return controller, controller.acquire("other-user")
+
+
+def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def test_overload_rejection_refunds_quota():
+    controller, _ = busy_controller(user_burst=1)
+
+    for _ in range(3):
+        with pytest.raises(AdmissionRejected, match="overloaded"):
+            controller.acquire("user", LOW)
+
+    assert controller.metrics()["rejected_quota_total"] == 0
+    assert controller.metrics()["rejected_overload_total"] == 3
+
+
+def test_cached_answer_refunds_quota():
+    controller, _ = busy_controller(user_burst=1)
+    controller.remember("Weather in Rome", "Sunny")
+
+    for _ in range(3):
+        assert controller.acquire("user", LOW, "weather in  rome").cached_answer == "Sunny"
+    assert controller.metrics()["served_cached_total"] == 3
+
+
+def test_quota_still_applies_to_admitted_plans():
+    controller = AdmissionController(user_burst=1, user_rate_per_minute=0.001)
+    controller.release(controller.acquire("user"))
+
+    with pytest.raises(AdmissionRejected, match="quota"):
+        controller.acquire("user")
+
+
+def test_export_metrics_is_prometheus_text():
+    controller, _ = busy_controller()
+    text = controller.export_metrics()
+
+    assert "# TYPE travel_planner_admission_admitted_total counter\ntravel_planner_admission_admitted_total 1\n" in text
+    assert "travel_planner_admission_in_flight 1\n" in text
+
+
+def test_high_priority_sheds_queued_low_priority():
+    controller = AdmissionController(max_in_flight=1, max_queue=1)
+    running = controller.acquire("other-user")
+    outcomes = {}
+
+    def request(user_id, priority):
+        try:
+            outcomes[user_id] = controller.acquire(user_id, priority)
+        except AdmissionRejected as e:
+            outcomes[user_id] = e
+
+    low = threading.Thread(target=request, args=("low-user", LOW))
+    low.start()
+    wait_until(lambda: controller.metrics()["queue_depth"] == 1)
+    high = threading.Thread(target=request, args=("high-user", HIGH))
+    high.start()
+    low.join(timeout=2)
+
+    assert isinstance(outcomes["low-user"], AdmissionRejected)
+    assert controller.metrics()["queue_depth"] == 1
+
+    controller.release(running)
+    high.join(timeout=2)
+    assert outcomes["high-user"].holds_slot and outcomes["high-user"].degraded
+    assert controller.metrics()["in_flight"] == 1
+
+
+def test_queued_request_times_out_per_class(monkeypatch):
+    monkeypatch.setitem(admission.QUEUE_TIMEOUT, LOW, 0.1)
+    controller = AdmissionController(max_in_flight=1, max_queue=2)
+    controller.acquire("other-user")
+
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected, match="overloaded"):
+        controller.acquire("user", LOW)
+
+    assert 0.1 <= time.monotonic() - started < 1
+    metrics = controller.metrics()
+    assert metrics["queue_timeouts_total"] == 1
+    assert metrics["queue_depth"] == 0
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError, match="urgent"):
+        AdmissionController().acquire("user", "urgent")
@@ -0,0 +1,157 @@
+import asyncio
+import importlib
+import sys
+
+import pytest
+from beeai_framework.agents.errors import AgentError
+from beeai_framework.backend.errors import ChatModelToolCallError
+
+import agent
+from agent import plan_trip, run_coordinator, run_specialist, split_per_city
+from src.concurrency import MAX_CONCURRENT_SPECIALISTS
+from src.incremental import TripPlan
+from src.prompt import RESPONSE_PROFILES, answer_max_tokens, response_format
+from src.query_parser import CULTURE, DESTINATION, WEATHER, TripQuery
+from tests.test_incremental import italy_plan
+
+
+def test_split_per_city_runs_culture_once_per_country():
+    trip = TripQuery(
+        text="Rome, Florence and Nice",
+        destinations=["Rome", "Florence", "Nice"],
+        geocoding={
+            "Rome": {"country": "Italy"},
+            "Florence": {"country": "Italy"},
+            "Nice": {"country": "France"},
+        },
+    )
+    jobs = [(key, list(trip.destinations)) for key in (DESTINATION, WEATHER, CULTURE)]
+
+    assert split_per_city(jobs, trip) == [
+        (DESTINATION, ["Rome"]), (WEATHER, ["Rome"]), (CULTURE, ["Rome", "Florence"]),
+        (DESTINATION, ["Florence"]), (WEATHER, ["Florence"]),
+        (DESTINATION, ["Nice"]), (WEATHER, ["Nice"]), (CULTURE, ["Nice"]),
+    ]
+
+
+def test_specialist_limit_is_shared_across_event_loops_and_reloads(monkeypatch):
+    running = []
+    peak = []
+
+    class FakeAgent:
+        async def run(self, query):
+            running.append(query)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(query)
+            return type("Result", (), {"output_structured": type("Output", (), {"response": query})()})()
+
+    # The Streamlit apps drop agent from sys.modules and import it again on every rerun
+    monkeypatch.delitem(sys.modules, "agent")
+    reloaded = importlib.import_module("agent")
+    assert reloaded is not agent
+    for module in (agent, reloaded):
+        monkeypatch.setitem(module.SPECIALIST_BUILDERS, DESTINATION, lambda llm, cache: FakeAgent())
+        monkeypatch.setattr(module, "build_tracked_llm", lambda key, stats, scope="": None)
+    trip = TripQuery(text="trip", destinations=[f"City {i}" for i in range(6)])
+
+    async def plan(module, cities):
+        await asyncio.gather(*(module.run_specialist(DESTINATION, None, trip, [city]) for city in cities))
+
+    threads = [
+        asyncio.to_thread(asyncio.run, plan(agent, trip.destinations[:3])),
+        asyncio.to_thread(asyncio.run, plan(reloaded, trip.destinations[3:])),
+    ]
+
+    async def both():
+        await asyncio.gather(*threads)
+
+    asyncio.run(both())
+    assert len(peak) == 6
+    assert max(peak) <= MAX_CONCURRENT_SPECIALISTS
+
+
+def fake_coordinator(monkeypatch, truncated_profiles):
+    """Coordinator whose answer is cut off (as a tool call error) for the given profiles."""
+    calls = []
+
+    class FakeCoordinator:
+        def __init__(self, max_tokens):
+            self.max_tokens = max_tokens
+
+        async def run(self, query):
+            profile = next(name for name in RESPONSE_PROFILES if answer_max_tokens(name) == self.max_tokens)
+            calls.append(profile)
+            if profile in truncated_profiles:
+                cause = ChatModelToolCallError(generated_error="Unterminated string", generated_content='{"response": "')
+                raise AgentError("Agent failed", cause=cause)
+            return type("Result", (), {"output_structured": type("Output", (), {"response": profile})()})()
+
+    monkeypatch.setattr(agent, "build_tracked_llm", lambda key, stats, max_tokens=None, scope="": max_tokens)
+    monkeypatch.setattr(agent, "build_travel_coordinator", FakeCoordinator)
+    return calls
+
+
+def test_answer_limit_leaves_headroom():
+    for profile, settings in RESPONSE_PROFILES.items():
+        assert answer_max_tokens(profile) > settings["target_tokens"] * 1.25
+
+
+def test_truncated_answer_falls_back_to_shorter_profile(monkeypatch):
+    calls = fake_coordinator(monkeypatch, truncated_profiles={"detailed"})
+
+    assert asyncio.run(run_coordinator("Plan Rome", "detailed")) == "standard"
+    assert calls == ["detailed", "standard"]
+
+
+def test_truncated_brief_answer_is_raised(monkeypatch):
+    fake_coordinator(monkeypatch, truncated_profiles={"brief"})
+
+    with pytest.raises(AgentError):
+        asyncio.run(run_coordinator("Plan Rome", "brief"))
+
+
+def test_followup_question_is_answered_from_stored_sections(monkeypatch):
+    queries = []
+
+    async def coordinator(query, profile, stats=None):
+        queries.append(query)
+        return "Pack layers and an umbrella"
+
+    monkeypatch.setattr(agent, "run_coordinator", coordinator)
+    monkeypatch.setattr(agent, "run_specialist", None)  # no specialist may rerun
+    plan = italy_plan()
+
+    answered = asyncio.run(plan_trip("What should I pack?", previous_plan=plan))
+
+    assert answered.answer == "Pack layers and an umbrella"
+    assert answered.sections == plan.sections and answered.trip is plan.trip
+    assert "What should I pack?" in queries[0] and "weather notes for Rome" in queries[0]
+    assert asyncio.run(plan_trip("Thanks!", previous_plan=answered)) is answered
+
+
+def test_lone_specialist_answers_in_the_profile_and_expands_on_rerun(monkeypatch):
+    calls = []
+
+    class FakeSpecialist:
+        def __init__(self, max_tokens):
+            self.max_tokens = max_tokens
+
+        async def run(self, query):
+            calls.append((self.max_tokens, query))
+            text = f"weather answer in {self.max_tokens} tokens"
+            return type("Result", (), {"output_structured": type("Output", (), {"response": text})()})()
+
+    monkeypatch.setitem(agent.SPECIALIST_BUILDERS, WEATHER, lambda llm, cache: FakeSpecialist(llm))
+    monkeypatch.setattr(agent, "build_tracked_llm", lambda key, stats, max_tokens=None, scope="": max_tokens)
+    monkeypatch.setattr(agent, "run_coordinator", None)  # no coordinator run is needed
+    trip = TripQuery(text="What's the weather in Rome tomorrow?", destinations=["Rome"])
+
+    section = asyncio.run(run_specialist(WEATHER, None, trip, ["Rome"], profile="brief"))
+    plan = TripPlan(trip=trip, sections=[section])
+
+    assert asyncio.run(agent.synthesize_plan(plan, "brief")) == f"weather answer in {answer_max_tokens('brief')} tokens"
+    assert response_format("brief") in calls[0][1]
+    detailed = asyncio.run(agent.expand_section(plan, 0))
+    assert detailed == f"weather answer in {answer_max_tokens('detailed')} tokens"
+    assert response_format("detailed") in calls[1][1]
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from beeai_framework.backend import AssistantMessage, ChatModelOutput, MessageToolCallContent, SystemMessage, UserMessage
+from beeai_framework.backend.types import ChatModelUsage
+from beeai_framework.tools import JSONToolOutput
+from beeai_framework.tools.search.wikipedia import WikipediaToolOutput
+from beeai_framework.tools.search.wikipedia.wikipedia import WikipediaToolResult
+
+from src.cassette import RECORD, REPLAY, Cassette, CassetteMiss
+
+
+class FakeLLM:
+    """Answers every prompt with its last user message."""
+
+    async def _create(self, chat_input, run):
+        return ChatModelOutput(output=[AssistantMessage(f"answer to {chat_input.messages[-1].text}")])
+
+    async def _create_stream(self, chat_input, run):
+        yield await self._create(chat_input, run)
+
+
+def prompt(text: str, now: str = "2026-10-19 10:00") -> SimpleNamespace:
+    system = SystemMessage(f"You are a travel expert.\n- The current date and time is: {now}")
+    return SimpleNamespace(messages=[system, UserMessage(text)], tools=[])
+
+
+def record(path, runs: list[tuple[str, str]]) -> None:
+    """Record one llm call per (scope, question), in the given order."""
+    cassette = Cassette(str(path), RECORD)
+    for scope, question in runs:
+        llm = cassette.wrap_llm(FakeLLM(), "weather", scope)
+        asyncio.run(llm._create(prompt(question), None))
+    cassette.save()
+
+
+def replay(cassette: Cassette, scope: str, question: str, now: str = "2026-10-20 08:30") -> str:
+    llm = cassette.wrap_llm(FakeLLM(), "weather", scope)
+    return asyncio.run(llm._create(prompt(question, now), None)).get_text_content()
+
+
+def test_replay_ignores_the_current_date(tmp_path):
+    record(tmp_path / "c.json", [("Rome", "Rome?")])
+    cassette = Cassette(str(tmp_path / "c.json"), REPLAY)
+
+    assert replay(cassette, "Rome", "Rome?") == "answer to Rome?"
+    assert cassette.stale_matches == 0
+
+
+def test_changed_prompt_is_served_its_own_agent_run(tmp_path):
+    record(tmp_path / "c.json", [("Rome", "Rome?"), ("Florence", "Florence?")])
+    cassette = Cassette(str(tmp_path / "c.json"), REPLAY)
+
+    # Concurrent runs finish in any order; an edited prompt still gets its own city's answer
+    assert replay(cassette, "Florence", "Weather in Florence?") == "answer to Florence?"
+    assert replay(cassette, "Rome", "Weather in Rome?") == "answer to Rome?"
+    assert cassette.stale_matches == 2
+
+
+def test_unrecorded_agent_run_misses(tmp_path):
+    record(tmp_path / "c.json", [("Rome", "Rome?")])
+    cassette = Cassette(str(tmp_path / "c.json"), REPLAY)
+
+    with pytest.raises(CassetteMiss):
+        replay(cassette, "Venice", "Venice?")
+
+
+def test_payloads_round_trip_as_json(tmp_path):
+    answer = ChatModelOutput(
+        output=[AssistantMessage([MessageToolCallContent(id="1", tool_name="final_answer", args='{"response": "Sunny"}')])],
+        usage=ChatModelUsage(prompt_tokens=1200, completion_tokens=40, total_tokens=1240),
+        finish_reason="tool_calls",
+    )
+    wikipedia = WikipediaToolOutput([WikipediaToolResult(title="Rome", description="Capital of Italy", url="https://en.wikipedia.org/wiki/Rome")])
+    weather = JSONToolOutput({"daily": {"temperature_2m_max": [21.5]}})
+    geocoding = {"name": "Rome", "country": "Italy", "latitude": 41.89, "longitude": 12.51}
+
+    async def interactions(cassette: Cassette):
+        async def value(result):
+            return result
+        return [
+            await cassette.acall("llm", "weather", "q", lambda: value(answer), {"scope": "Rome", "step": 0}),
+            await cassette.acall("tool", "Wikipedia", "Rome", lambda: value(wikipedia)),
+            await cassette.acall("tool", "OpenMeteoTool", "Rome", lambda: value(weather)),
+            cassette.call("geocode", "geocoding", "Rome", lambda: geocoding),
+        ]
+
+    recording = Cassette(str(tmp_path / "c.json"), RECORD)
+    asyncio.run(interactions(recording))
+    recording.save()
+    llm, wiki, meteo, location = asyncio.run(interactions(Cassette(str(tmp_path / "c.json"), REPLAY)))
+
+    assert llm.get_tool_calls()[0].args == '{"response": "Sunny"}'
+    assert llm.usage.completion_tokens == 40 and llm.finish_reason == "tool_calls"
+    assert isinstance(wiki, WikipediaToolOutput) and wiki.get_text_content() == wikipedia.get_text_content()
+    assert isinstance(meteo, JSONToolOutput) and meteo.result == weather.result
+    assert location == geocoding
@@ -0,0 +1,140 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from src import query_parser
+from src.incremental import Section, TripPlan, diff_plan, is_acknowledgement, merge_followup, patch_plan
+from src.query_parser import CULTURE, DESTINATION, WEATHER, parse_query
+
+
+TODAY = date(2026, 10, 19)
+
+
+COUNTRIES = {
+    "Rome": "Italy", "Florence": "Italy", "Venice": "Italy", "Naples": "Italy", "Nice": "France",
+    "Lisbon": "Portugal",
+}
+
+
+@pytest.fixture(autouse=True)
+def offline_geocoding(monkeypatch):
+    monkeypatch.setattr(
+        query_parser, "geocode",
+        lambda name: {"name": name, "country": COUNTRIES[name]} if name in COUNTRIES else None,
+    )
+
+
+def merge(trip, text):
+    return asyncio.run(merge_followup(trip, text))
+
+
+def with_geocoding(trip):
+    trip.geocoding.update({city: {"name": city, "country": COUNTRIES[city]} for city in trip.destinations})
+    return trip
+
+
+def italy_plan() -> TripPlan:
+    trip = with_geocoding(parse_query("Plan a trip to Rome and Florence from 2027-05-10 to 2027-05-17.", today=TODAY))
+    sections = [
+        Section(specialist, [city], f"{specialist} notes for {city}")
+        for specialist in (DESTINATION, WEATHER)
+        for city in trip.destinations
+    ]
+    sections.append(Section(CULTURE, ["Rome", "Florence"], "culture notes for Italy"))
+    return TripPlan(trip=trip, sections=sections, answer="Rome and Florence itinerary")
+
+
+def test_add_city_reruns_city_level_specialists_for_it_only():
+    plan = italy_plan()
+    trip = with_geocoding(merge(plan.trip, "Also add Venice"))
+
+    assert trip.destinations == ["Rome", "Florence", "Venice"]
+    diff = diff_plan(plan, trip)
+    # Italy's culture is already covered
+    assert diff.reruns == {DESTINATION: ["Venice"], WEATHER: ["Venice"]}
+    assert diff.removed_cities == []
+
+
+def test_add_city_in_new_country_runs_culture():
+    plan = italy_plan()
+    trip = with_geocoding(merge(plan.trip, "Also add Nice"))
+
+    assert diff_plan(plan, trip).reruns == {DESTINATION: ["Nice"], WEATHER: ["Nice"], CULTURE: ["Nice"]}
+
+
+def test_replace_city_keeps_its_position():
+    plan = italy_plan()
+    trip = with_geocoding(merge(plan.trip, "Replace Florence with Venice"))
+
+    assert trip.destinations == ["Rome", "Venice"]
+    diff = diff_plan(plan, trip)
+    assert diff.removed_cities == ["Florence"]
+    assert diff.reruns == {DESTINATION: ["Venice"], WEATHER: ["Venice"]}
+
+
+def test_instead_of_and_lowercase_replace():
+    plan = italy_plan()
+    assert merge(plan.trip, "Let's do Naples instead of Rome").destinations == ["Naples", "Florence"]
+    assert merge(plan.trip, "swap florence for venice please").destinations == ["Rome", "Venice"]
+
+
+def test_single_date_edit_keeps_trip_length():
+    plan = italy_plan()
+    trip = merge(plan.trip, "Make it 2027-06-03")
+
+    assert trip.start_date == date(2027, 6, 3)
+    assert trip.end_date == date(2027, 6, 10)
+    assert diff_plan(plan, trip).reruns == {WEATHER: ["Rome", "Florence"]}
+
+
+def test_date_range_edit_replaces_both_dates():
+    plan = italy_plan()
+    trip = merge(plan.trip, "Change the dates to 2027-06-01 - 2027-06-04")
+
+    assert (trip.start_date, trip.end_date) == (date(2027, 6, 1), date(2027, 6, 4))
+
+
+def test_message_without_changes_has_empty_diff():
+    plan = italy_plan()
+    trip = merge(plan.trip, "Thanks!")
+
+    assert trip.destinations == plan.trip.destinations
+    assert diff_plan(plan, trip).is_empty
+
+
+def test_only_acknowledgements_need_no_answer():
+    assert is_acknowledgement("Thanks!")
+    assert is_acknowledgement("OK, got it, thank you so much")
+    assert not is_acknowledgement("What should I pack?")
+    assert not is_acknowledgement("Thanks! Do I need a visa?")
+
+
+def test_new_trip_is_not_a_followup():
+    assert merge(italy_plan().trip, "Plan a trip to Lisbon in June") is None
+
+
+def test_question_with_a_phantom_place_stays_a_followup():
+    plan = italy_plan()
+    trip = merge(plan.trip, "Is it safe to walk at night?")
+
+    assert trip is not None
+    assert trip.destinations == ["Rome", "Florence"]
+    assert diff_plan(plan, trip).is_empty
+
+
+def test_patch_plan_replaces_outdated_sections():
+    plan = italy_plan()
+    trip = with_geocoding(merge(plan.trip, "Replace Florence with Venice"))
+    diff = diff_plan(plan, trip)
+    new_sections = [Section(specialist, ["Venice"], f"{specialist} notes for Venice") for specialist in diff.reruns]
+
+    patched = patch_plan(plan, trip, diff, new_sections)
+
+    covered = sorted((section.specialist, tuple(section.cities)) for section in patched.sections)
+    assert covered == sorted([
+        (DESTINATION, ("Rome",)), (DESTINATION, ("Venice",)),
+        (WEATHER, ("Rome",)), (WEATHER, ("Venice",)),
+        (CULTURE, ("Rome", "Florence")),
+    ])
+    assert patched.trip is trip
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+from src.prefetch import (
+    CachedOpenMeteoTool, CachedWikipediaTool, PrefetchCache, _prefetch, _speculative, weather_key, wikipedia_key,
+)
+
+
+@pytest.mark.parametrize("tool_class", [CachedWikipediaTool, CachedOpenMeteoTool])
+def test_clone_keeps_shared_cache(tool_class):
+    cache = PrefetchCache()
+    tool = tool_class(cache)
+
+    clone = asyncio.run(tool.clone())
+
+    assert type(clone) is tool_class
+    assert clone.prefetch_cache is cache
+    assert clone.name == tool.name
+
+
+def test_hidden_latency_counts_each_prefetch_once():
+    async def scenario():
+        cache = PrefetchCache()
+        fetches = []
+
+        async def fetch():
+            fetches.append(1)
+            await asyncio.sleep(0.01)
+            return "data"
+
+        async def prefetch():
+            _speculative.set(True)
+            return await cache.get_or_run("wikipedia:rome", fetch)
+
+        await asyncio.create_task(prefetch())
+        await cache.get_or_run("wikipedia:rome", fetch)
+        await cache.get_or_run("wikipedia:rome", fetch)
+        await cache.get_or_run("wikipedia:kyoto", fetch)
+        await cache.get_or_run("wikipedia:kyoto", fetch)
+        return cache, len(fetches)
+
+    cache, fetches = asyncio.run(scenario())
+    report = cache.report()
+
+    assert fetches == 2
+    assert report["prefetched"] == 1
+    assert report["hits"] == 1
+    assert report["misses"] == 1
+    assert 0 < report["hidden_latency_seconds"] < 1
+
+    cache.reset_stats()
+    assert cache.report() == {"prefetched": 0, "hits": 0, "misses": 0, "hidden_latency_seconds": 0}
+
+
+def test_cache_keys_keep_inputs_that_change_the_result():
+    assert wikipedia_key("Rome") != wikipedia_key("Rome", full_text=True)
+    assert weather_key("Paris, Texas") != weather_key("Paris")
+    assert weather_key("Paris", country="United States") != weather_key("Paris")
+    assert weather_key("Rome", temperature_unit="fahrenheit") != weather_key("Rome")
+
+
+def test_pre_resolved_location_needs_matching_suffix():
+    cache = PrefetchCache()
+    kyoto = {"name": "Kyoto", "country": "Japan", "latitude": 35.02, "longitude": 135.75}
+    paris = {"name": "Paris", "country": "France", "latitude": 48.85, "longitude": 2.35}
+    cache.add_locations({"Kyoto": kyoto, "Paris": paris})
+
+    assert cache.resolve("Kyoto, Japan") is kyoto
+    assert cache.resolve("kyoto", country="Japan") is kyoto
+    assert cache.resolve("Paris, Texas") is None
+    assert cache.resolve("Paris", country="United States") is None
+    # "Kyoto" and "Kyoto, Japan" resolve to one place and share the prefetched entry
+    assert weather_key("Kyoto, Japan", "2027-04-03", location=cache.resolve("Kyoto, Japan")) == weather_key(
+        "Kyoto", "2027-04-03", location=cache.resolve("Kyoto")
+    )
+
+
+def test_wikipedia_prefetch_runs_off_the_event_loop():
+    class Page:
+        title = "Rome"
+        summary = "Capital of Italy"
+        fullurl = "https://en.wikipedia.org/wiki/Rome"
+        langlinks = {}
+
+        def exists(self):
+            return True
+
+    class SlowClient:
+        def page(self, query):
+            time.sleep(0.3)  # blocking HTTP round trip
+            return Page()
+
+    async def scenario():
+        cache = PrefetchCache()
+        tool = CachedWikipediaTool(cache)
+        tool.client = SlowClient()
+        prefetch = asyncio.create_task(_prefetch(tool, {"query": "Rome"}))
+        ticks = 0
+        while not prefetch.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        output = await tool.run({"query": "Rome"})
+        return ticks, output, cache.report()
+
+    ticks, output, report = asyncio.run(scenario())
+
+    # Other coroutines kept running while the page was fetched
+    assert ticks >= 10
+    assert output.results[0].description == "Capital of Italy"
+    assert report["prefetched"] == 1 and report["hits"] == 1
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+import agent
+from src.prompt_cache import measure_prompt_layout, render_system_prompts
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return agent.build_agents()
+
+
+def test_instructions_are_static_across_steps(agents):
+    renders = asyncio.run(render_system_prompts(agents[agent.DESTINATION]))
+
+    assert len(renders) > 2
+    static_parts = {text.split("# Tools")[0] for text, _ in renders}
+    assert len(static_parts) == 1
+    assert agent.SYSTEM_INSTRUCTIONS[agent.DESTINATION].splitlines()[0] in static_parts.pop()
+
+
+def test_layout_report_counts_tool_sets_sent_per_step(agents):
+    renders = asyncio.run(render_system_prompts(agents[agent.DESTINATION]))
+    report = measure_prompt_layout(renders)
+
+    # Requirements change the allowed tools between steps, and only those are sent
+    assert report["tool_sets"] == len({tuple(tool.name for tool in tools) for _, tools in renders}) > 1
+    assert report["cacheable_prefix_tokens"] == report["shared_prefix_tokens"]
+
+
+def test_layout_report_checks_provider_minimum(agents):
+    report = measure_prompt_layout(asyncio.run(render_system_prompts(agents[agent.WEATHER])))
+
+    assert report["shared_prefix_tokens"] <= report["system_prompt_tokens"]
+    assert report["meets_provider_minimum"] == (report["cacheable_prefix_tokens"] >= 1024)
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from src import query_parser
+from src.query_parser import CULTURE, WEATHER, extract_destinations, parse_query, prefill_geocoding
+
+
+TODAY = date(2026, 10, 19)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Plan a trip to Rome and Florence", ["Rome", "Florence"]),
+        ("What's the weather in Rome next week?", ["Rome"]),
+        ("Tell me about Lisbon", ["Lisbon"]),
+        ("what's the weather in rome next week?", ["Rome"]),
+        ("plan a trip to new york in may", ["New York"]),
+        ("How do I say thank you in Japanese?", []),
+        ("I want to be respectful of Japanese customs", []),
+        ("Is it rainy in Spring?", []),
+        ("Where should I go for New Year?", []),
+        ("Tips for Chinese New Year in Taipei", ["Taipei"]),
+        ("A weekend in Dalian", ["Dalian"]),
+        ("Any Italian food tips for Rome?", ["Rome"]),
+    ],
+)
+def test_extract_destinations(text, expected):
+    assert extract_destinations(text)[0] == expected
+
+
+def test_country_with_cities():
+    destinations, country = extract_destinations("A trip to Japan (Tokyo and Osaka) in April")
+    assert destinations == ["Tokyo", "Osaka"]
+    assert country == "Japan"
+
+
+@pytest.mark.parametrize(
+    "text, expected, country",
+    [
+        ("Trip to Tokyo and Osaka (2 weeks)", ["Tokyo", "Osaka"], None),
+        ("Two weeks in New Zealand (Auckland and Queenstown)", ["Auckland", "Queenstown"], "New Zealand"),
+        ("Visit Japan (Tokyo, Kyoto)", ["Tokyo", "Kyoto"], "Japan"),
+        # Nothing in the parentheses is a place, fall back to the preposition pass
+        ("Hiking in Japan (Japanese Alps)", ["Japan"], None),
+    ],
+)
+def test_parentheses_only_list_cities(text, expected, country):
+    assert extract_destinations(text) == (expected, country)
+
+
+def test_japanese_customs_is_not_a_destination():
+    trip = parse_query(
+        "I'm visiting Kyoto from 2027-04-03 to 2027-04-09 and want to be respectful of Japanese customs",
+        today=TODAY,
+    )
+    assert trip.destinations == ["Kyoto"]
+    assert trip.start_date == date(2027, 4, 3)
+    assert trip.end_date == date(2027, 4, 9)
+
+
+def test_narrow_query_selects_one_specialist():
+    assert parse_query("What's the weather in Rome tomorrow?", today=TODAY).specialists == [WEATHER]
+    assert parse_query("Any tipping etiquette in Rome?", today=TODAY).specialists == [CULTURE]
+
+
+def test_prefill_geocoding_drops_unknown_places(monkeypatch):
+    locations = {"Rome": {"name": "Rome", "country": "Italy", "latitude": 41.89, "longitude": 12.51}}
+    monkeypatch.setattr(query_parser, "geocode", lambda name: locations.get(name))
+
+    trip = parse_query("Plan a trip to Rome and Relaxing Beaches", today=TODAY)
+    asyncio.run(prefill_geocoding(trip))
+
+    assert trip.destinations == ["Rome"]
+    assert trip.country == "Italy"
+    assert trip.geocoding["Rome"]["latitude"] == 41.89
+
+
+def test_prefill_geocoding_keeps_candidates_when_lookup_fails(monkeypatch):
+    def unreachable(name):
+        raise ConnectionError("geocoding API unreachable")
+
+    monkeypatch.setattr(query_parser, "geocode", unreachable)
+
+    trip = parse_query("Plan a trip to Rome", today=TODAY)
+    asyncio.run(prefill_geocoding(trip))
+
+    assert trip.destinations == ["Rome"]
+    assert trip.geocoding == {}
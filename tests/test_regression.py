@@ -0,0 +1,32 @@
+import asyncio
+import os
+
+import pytest
+
+from src import regression
+from src.cassette import REPLAY
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNTED = ("llm_calls", "tool_calls", "prompt_tokens", "completion_tokens")
+
+
+@pytest.fixture(autouse=True)
+def committed_cassettes(monkeypatch):
+    # The committed cassettes were recorded from tests/stubs.py; replaying them needs no key or network
+    cassettes = os.path.join(ROOT, "cassettes")
+    monkeypatch.setattr(regression, "CASSETTE_DIR", cassettes)
+    monkeypatch.setattr(regression, "BASELINE_PATH", os.path.join(cassettes, "baselines.json"))
+    monkeypatch.setenv("OPENAI_API_KEY", "replay")
+
+
+@pytest.mark.parametrize("scenario", ["rome_weather", "italy_followup"])
+def test_committed_cassette_replays_through_plan_trip(scenario):
+    baseline = regression.load_baselines()[scenario]
+
+    metrics, stale = asyncio.run(regression.run_scenario(scenario, REPLAY))
+
+    assert stale == 0
+    assert {name: metrics[name] for name in COUNTED} == {name: baseline[name] for name in COUNTED}
+    # Wall-clock overhead depends on the machine; only the counted metrics are exact
+    assert regression.compare({**metrics, "overhead_seconds": 0}, baseline) == []